@@ -2,11 +2,17 @@ from functools import wraps
 from flask import abort
 from flask_login import current_user
 
+ADMIN_ID = 1
+
+
+def is_admin():
+    return current_user.is_authenticated and current_user.id == ADMIN_ID
+
 
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if current_user.id != 1:
+        if not is_admin():
             return abort(403)
         return f(*args, **kwargs)
 
@@ -1,12 +1,24 @@
 from flask import Flask
 from config import Config
-from extensions import db, login_manager, ckeditor, bootstrap, gravatar, csrf, limiter
+from extensions import db, login_manager, ckeditor, bootstrap, gravatar, csrf, limiter, page_cache, recaptcha
 from auth.routes import auth_bp
 from main.routes import main_bp
 from main.postroutes import post_bp
 from main.commentroutes import comment_bp
 from main.ratingroutes import rating_bp
-from models.models import UserBlog
+from models.transactions import seed_feed_state
+from commands import upgrade_db_command, recompute_ratings_command, backfill_avatars_command, outbox_worker_command, \
+    rebuild_search_command, build_images_command, vendor_assets_command, build_assets_command, import_posts_command, \
+    set_password_command, export_content_command
+from utils import avatar_url
+from outbox import outbox
+from usercache import user_cache
+from search import search_index
+from images import images
+from assets import assets
+from instrumentation import sql_instrumentation
+from profiler import profiler
+from pragmas import sqlite_pragmas
 
 
 def create_app():
@@ -15,25 +27,39 @@ def create_app():
 
     register_extensions(flask_app)
     register_blueprints(flask_app)
+    register_commands(flask_app)
+    register_template_filters(flask_app)
     with flask_app.app_context():
         db.create_all()
+        seed_feed_state()
+        search_index.create()
 
     return flask_app
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    return db.session.get(UserBlog, user_id)
+    return user_cache.load(user_id)
 
 
 def register_extensions(flask_app):
     db.init_app(flask_app)
+    sqlite_pragmas.init_app(flask_app)
     login_manager.init_app(flask_app)
     ckeditor.init_app(flask_app)
     bootstrap.init_app(flask_app)
     gravatar.init_app(flask_app)
     csrf.init_app(flask_app)
     limiter.init_app(flask_app)
+    page_cache.init_app(flask_app)
+    recaptcha.init_app(flask_app)
+    outbox.init_app(flask_app)
+    user_cache.init_app(flask_app)
+    search_index.init_app(flask_app)
+    images.init_app(flask_app)
+    assets.init_app(flask_app)
+    sql_instrumentation.init_app(flask_app)
+    profiler.init_app(flask_app)
 
 
 def register_blueprints(flask_app):
@@ -44,6 +70,24 @@ def register_blueprints(flask_app):
     flask_app.register_blueprint(rating_bp)
 
 
+def register_commands(flask_app):
+    flask_app.cli.add_command(upgrade_db_command)
+    flask_app.cli.add_command(recompute_ratings_command)
+    flask_app.cli.add_command(backfill_avatars_command)
+    flask_app.cli.add_command(outbox_worker_command)
+    flask_app.cli.add_command(rebuild_search_command)
+    flask_app.cli.add_command(build_images_command)
+    flask_app.cli.add_command(vendor_assets_command)
+    flask_app.cli.add_command(build_assets_command)
+    flask_app.cli.add_command(import_posts_command)
+    flask_app.cli.add_command(set_password_command)
+    flask_app.cli.add_command(export_content_command)
+
+
+def register_template_filters(flask_app):
+    flask_app.add_template_filter(avatar_url, 'avatar')
+
+
 app = create_app()
 
 if __name__ == "__main__":
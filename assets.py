@@ -0,0 +1,240 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from urllib.parse import urljoin, urlsplit
+import requests
+from flask import current_app, request, send_from_directory, url_for
+from markupsafe import Markup
+
+# Third-party assets kept under static/vendor by `flask vendor-assets`, with the URL each one comes from. Until
+# they are vendored, pages load them from these URLs.
+VENDOR = {
+    'vendor/clean-blog/styles.min.css':
+        'https://cdn.jsdelivr.net/npm/startbootstrap-clean-blog@6.0.9/dist/css/styles.min.css',
+    'vendor/fontawesome/all.min.css':
+        'https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.3.0/css/all.min.css',
+    'vendor/fonts/lora.css':
+        'https://fonts.googleapis.com/css?family=Lora:400,700,400italic,700italic',
+    'vendor/fonts/open-sans.css':
+        'https://fonts.googleapis.com/css?family=Open+Sans:300italic,400italic,600italic,700italic,800italic,'
+        '400,300,600,700,800',
+    'vendor/bootstrap/bootstrap.bundle.min.js':
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.2.3/dist/js/bootstrap.bundle.min.js',
+}
+BUNDLES = {
+    'app.css': ['vendor/clean-blog/styles.min.css', 'vendor/fontawesome/all.min.css', 'vendor/fonts/lora.css',
+                'vendor/fonts/open-sans.css', 'css/styles.css'],
+    'app.js': ['vendor/bootstrap/bootstrap.bundle.min.js', 'js/scripts.js'],
+}
+# Worth precompressing; images and woff2 fonts are compressed already.
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.html', '.txt', '.ttf', '.eot', '.xml')
+# Google Fonts only serves woff2 to browsers it recognises.
+USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+              'Chrome/124.0 Safari/537.36')
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+
+def vendor_assets(static_folder, timeout=30):
+    # Downloads every VENDOR file, and the fonts its CSS references into a files/ directory next to it.
+    session = requests.Session()
+    session.headers['User-Agent'] = USER_AGENT
+    written = []
+    for path, url in VENDOR.items():
+        response = session.get(url, timeout=timeout)
+        response.raise_for_status()
+        target = os.path.join(static_folder, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        content = response.content
+        if path.endswith('.css'):
+            def fetch(match):
+                reference = match.group(2)
+                if reference.startswith('data:'):
+                    return match.group(0)
+                location = urljoin(url, reference)
+                name = os.path.basename(urlsplit(location).path)
+                fragment = '#' + urlsplit(location).fragment if urlsplit(location).fragment else ''
+                file_path = os.path.join(os.path.dirname(target), 'files', name)
+                if not os.path.exists(file_path):
+                    file_response = session.get(location, timeout=timeout)
+                    file_response.raise_for_status()
+                    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                    with open(file_path, 'wb') as file:
+                        file.write(file_response.content)
+                    written.append(os.path.relpath(file_path, static_folder))
+                return f'url(files/{name}{fragment})'
+
+            content = CSS_URL.sub(fetch, response.text).encode('utf-8')
+        with open(target, 'wb') as file:
+            file.write(content)
+        written.append(path)
+    return written
+
+
+def minify_css(css):
+    css = re.sub(r'/\*(?!!).*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    return css.replace(';}', '}').strip()
+
+
+def minify_js(js):
+    # Conservative: indentation, blank lines and whole-line comments only, line breaks stay for ASI.
+    lines = (line.strip() for line in js.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+
+def hashed_name(path, data):
+    stem, extension = os.path.splitext(os.path.basename(path))
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{extension}"
+
+
+def write_file(output_dir, name, data):
+    # Writes the file and its .gz/.br siblings. Names carry a content hash, an existing file is already right.
+    path = os.path.join(output_dir, name)
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    variants = [('', data)]
+    if name.endswith(COMPRESSIBLE):
+        variants.append(('.gz', gzip.compress(data, compresslevel=9, mtime=0)))
+        try:
+            import brotli
+            variants.append(('.br', brotli.compress(data, quality=11)))
+        except ImportError:
+            pass
+    for suffix, content in variants:
+        with open(path + suffix + '.tmp', 'wb') as file:
+            file.write(content)
+        os.replace(path + suffix + '.tmp', path + suffix)
+
+
+def build_assets(static_folder, output_dir, ckeditor_folder=None):
+    # Bundles and minifies BUNDLES, copies the files their CSS references and the CKEditor package under
+    # content-hashed names, precompresses them and writes manifest.json. Returns the manifest.
+    missing = [path for bundle in BUNDLES.values() for path in bundle
+               if not os.path.exists(os.path.join(static_folder, path))]
+    if missing:
+        raise FileNotFoundError(f"Missing {', '.join(missing)}, run flask vendor-assets first")
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = {}
+    for bundle, sources in BUNDLES.items():
+        parts = []
+        for source in sources:
+            with open(os.path.join(static_folder, source), encoding='utf-8') as file:
+                content = file.read()
+            if bundle.endswith('.css'):
+                content = rewrite_css_urls(content, static_folder, source, output_dir, manifest)
+                if not source.endswith('.min.css'):
+                    content = minify_css(content)
+            elif not source.endswith('.min.js'):
+                content = minify_js(content)
+            parts.append(content)
+        data = ('\n' if bundle.endswith('.css') else ';\n').join(parts).encode('utf-8')
+        manifest[bundle] = hashed_name(bundle, data)
+        write_file(output_dir, manifest[bundle], data)
+
+    if ckeditor_folder:
+        # CKEditor loads its plugins, skins and languages relative to ckeditor.js, so the package keeps its
+        # layout under a directory named after the hash of its contents.
+        digest = hashlib.sha256()
+        files = []
+        for root, _, names in sorted(os.walk(ckeditor_folder)):
+            for name in sorted(names):
+                path = os.path.join(root, name)
+                with open(path, 'rb') as file:
+                    data = file.read()
+                relative = os.path.relpath(path, ckeditor_folder).replace(os.sep, '/')
+                digest.update(relative.encode('utf-8') + b'\0' + data)
+                files.append((relative, data))
+        directory = f"ckeditor/{digest.hexdigest()[:12]}"
+        for relative, data in files:
+            write_file(output_dir, f"{directory}/{relative}", data)
+        manifest['ckeditor/ckeditor.js'] = f"{directory}/ckeditor.js"
+
+    with open(os.path.join(output_dir, 'manifest.json.tmp'), 'w') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(os.path.join(output_dir, 'manifest.json.tmp'), os.path.join(output_dir, 'manifest.json'))
+    return manifest
+
+
+def rewrite_css_urls(css, static_folder, source, output_dir, manifest):
+    # Points relative url()s at hashed copies next to the bundle.
+    def rewrite(match):
+        reference = match.group(2)
+        if reference.startswith(('data:', 'http:', 'https:', '//', '#', '/')):
+            return match.group(0)
+        parts = urlsplit(reference)
+        path = os.path.normpath(os.path.join(os.path.dirname(source), parts.path)).replace(os.sep, '/')
+        if path not in manifest:
+            with open(os.path.join(static_folder, path), 'rb') as file:
+                data = file.read()
+            manifest[path] = hashed_name(path, data)
+            write_file(output_dir, manifest[path], data)
+        fragment = f'#{parts.fragment}' if parts.fragment else ''
+        return f'url({manifest[path]}{fragment})'
+
+    return CSS_URL.sub(rewrite, css)
+
+
+class Assets:
+    # Serves what `flask build-assets` wrote, precompressed when the client accepts it. Without a build,
+    # templates get the individual source files instead.
+    def __init__(self):
+        self.manifest = {}
+        self.output_dir = None
+
+    def init_app(self, app):
+        self.output_dir = app.config['ASSET_BUILD_DIR']
+        self.load()
+        app.add_url_rule('/assets/<path:filename>', 'asset', self.send)
+        app.add_template_global(self.asset_url, 'asset_url')
+        app.add_template_global(self.asset_tags, 'asset_tags')
+        app.extensions['assets'] = self
+
+    def load(self):
+        try:
+            with open(os.path.join(self.output_dir, 'manifest.json')) as file:
+                self.manifest = json.load(file)
+        except (OSError, ValueError):
+            self.manifest = {}
+
+    def asset_url(self, filename):
+        if filename in self.manifest:
+            return url_for('asset', filename=self.manifest[filename])
+        if filename == 'ckeditor/ckeditor.js':
+            return url_for('ckeditor.static', filename=f"{current_app.config['CKEDITOR_PKG_TYPE']}/ckeditor.js")
+        if filename in VENDOR and not os.path.exists(os.path.join(current_app.static_folder, filename)):
+            return VENDOR[filename]
+        return url_for('static', filename=filename)
+
+    def asset_tags(self, bundle):
+        urls = [self.asset_url(bundle)] if bundle in self.manifest else \
+            [self.asset_url(source) for source in BUNDLES[bundle]]
+        if bundle.endswith('.css'):
+            return Markup(''.join(f'<link href="{url}" rel="stylesheet"/>\n' for url in urls))
+        return Markup(''.join(f'<script src="{url}"></script>\n' for url in urls))
+
+    def send(self, filename):
+        # Content-hashed names never change meaning, so responses are cached for good. The .br/.gz sibling is
+        # sent when the client accepts it.
+        mimetype = mimetypes.guess_type(filename)[0]
+        encoding = None
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if request.accept_encodings[candidate] and os.path.isfile(os.path.join(self.output_dir, filename + suffix)):
+                encoding = candidate
+                filename += suffix
+                break
+        response = send_from_directory(self.output_dir, filename, max_age=31536000, mimetype=mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.cache_control.immutable = True
+        response.cache_control.public = True
+        return response
+
+
+assets = Assets()
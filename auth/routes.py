@@ -6,7 +6,7 @@ from extensions import limiter
 from models.models import UserBlog
 from models.transactions import get_user_by_email, add, DatabaseError
 from .forms import RegisterForm, LoginForm
-from utils import sanitize_input, validate_email
+from utils import sanitize_input, validate_email, avatar_hash
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -25,7 +25,7 @@ def register():
             return redirect(url_for('auth.register'))
 
         hashed_password = generate_password_hash(password, method='pbkdf2:sha256', salt_length=8)
-        new_user = UserBlog(email=email, name=name, password=hashed_password)
+        new_user = UserBlog(email=email, name=name, password=hashed_password, avatar_hash=avatar_hash(email))
 
         try:
             add(new_user)
@@ -57,6 +57,11 @@ def login():
                 flash('Email not found!', 'error')
                 return redirect(url_for('auth.login'))
 
+            # Authors imported by email have no password until the admin runs `flask set-password`.
+            elif not user.password:
+                flash('This account has no password yet, ask the administrator to set one.', 'error')
+                return redirect(url_for('auth.login'))
+
             elif not check_password_hash(user.password, password):
                 flash('Password incorrect, please try again.', 'error')
                 return redirect(url_for('auth.login'))
@@ -0,0 +1,86 @@
+"""Synthetic users, posts, comments and ratings for benchmarks.
+
+Call seed() inside an app context, against an empty database.
+"""
+import random
+from werkzeug.security import generate_password_hash
+from extensions import db
+from models.models import UserBlog, BlogPost, Comment, Rating
+from search import search_index
+from utils import avatar_hash
+
+PASSWORD = 'benchmark-password'
+WORDS = ('flask', 'python', 'database', 'query', 'index', 'cache', 'latency', 'server', 'template', 'request',
+         'garden', 'tomato', 'travel', 'mountain', 'coffee', 'morning', 'river', 'music', 'guitar', 'novel',
+         'design', 'pattern', 'network', 'packet', 'kernel', 'thread', 'memory', 'profile', 'budget', 'invoice',
+         'the', 'a', 'of', 'and', 'to', 'in', 'is', 'that', 'it', 'with', 'for', 'as', 'on', 'was', 'this')
+
+
+def sentence(rng, low=6, high=18):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(low, high))]
+    return ' '.join(words).capitalize() + '.'
+
+
+def paragraph(rng, sentences=(3, 7)):
+    return ' '.join(sentence(rng) for _ in range(rng.randint(*sentences)))
+
+
+def post_body(rng, paragraphs=8):
+    # The mix of markup CKEditor produces: headings, emphasis, links, lists, quotes and images.
+    blocks = []
+    for index in range(paragraphs):
+        kind = rng.random()
+        if index and kind < 0.15:
+            blocks.append(f"<h2>{sentence(rng, 2, 5)}</h2>")
+        elif kind < 0.25:
+            items = ''.join(f"<li>{sentence(rng, 3, 8)}</li>" for _ in range(rng.randint(3, 6)))
+            blocks.append(f"<ul>{items}</ul>")
+        elif kind < 0.32:
+            blocks.append(f"<blockquote><p>{paragraph(rng, (1, 3))}</p></blockquote>")
+        elif kind < 0.37:
+            blocks.append(f'<p><img alt="" src="https://picsum.photos/seed/{rng.randint(1, 10 ** 6)}/800/400" '
+                          f'style="height:400px; width:800px" /></p>')
+        text = paragraph(rng)
+        words = text.split(' ')
+        position = rng.randrange(len(words))
+        words[position] = f"<strong>{words[position]}</strong>"
+        if len(words) > 4:
+            words[-3] = f'<a href="https://example.com/{rng.choice(WORDS)}">{words[-3]}</a>'
+        blocks.append(f"<p>{' '.join(words)}</p>")
+    return '\n'.join(blocks)
+
+
+def seed(users=200, posts=500, comments_per_post=10, ratings_per_post=5, paragraphs=8, random_seed=1):
+    """Inserts the dataset and returns a summary of what was created.
+
+    User 1 is the admin, users 2-10 may post and author the posts. Comments and ratings come from distinct users per
+    post, so comments_per_post and ratings_per_post are capped at the number of users.
+    """
+    rng = random.Random(random_seed)
+    password = generate_password_hash(PASSWORD, method='pbkdf2:sha256', salt_length=8)
+    authors = min(10, users)
+    db.session.execute(db.insert(UserBlog), [
+        {'id': user_id, 'email': f"user{user_id}@example.com", 'name': f"User {user_id}", 'password': password,
+         'add_post': user_id <= authors, 'request': False, 'avatar_hash': avatar_hash(f"user{user_id}@example.com")}
+        for user_id in range(1, users + 1)])
+
+    post_rows, comment_rows, rating_rows = [], [], []
+    for post_id in range(1, posts + 1):
+        ratings = [{'post_id': post_id, 'author_id': author_id, 'value': float(rng.randint(0, 10))}
+                   for author_id in rng.sample(range(1, users + 1), min(ratings_per_post, users))]
+        post_rows.append({
+            'id': post_id, 'author_id': rng.randint(1, authors), 'title': f"{sentence(rng, 3, 7)[:-1]} #{post_id}",
+            'subtitle': sentence(rng, 5, 10), 'date': f"May {rng.randint(1, 28):02d}, 2024",
+            'body': post_body(rng, paragraphs), 'img_url': f"https://picsum.photos/seed/{post_id}/1920/1080",
+            'rating_count': len(ratings), 'rating_sum': sum(rating['value'] for rating in ratings)})
+        rating_rows.extend(ratings)
+        comment_rows.extend({'post_id': post_id, 'author_id': author_id, 'text': f"<p>{paragraph(rng, (1, 3))}</p>"}
+                            for author_id in rng.sample(range(1, users + 1), min(comments_per_post, users)))
+
+    for model, rows in ((BlogPost, post_rows), (Comment, comment_rows), (Rating, rating_rows)):
+        for start in range(0, len(rows), 1000):
+            db.session.execute(db.insert(model), rows[start:start + 1000])
+    db.session.commit()
+    # Bulk inserts bypass the session hooks that keep the search index current.
+    search_index.rebuild()
+    return {'users': users, 'posts': posts, 'comments': len(comment_rows), 'ratings': len(rating_rows)}
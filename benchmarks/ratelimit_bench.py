@@ -0,0 +1,108 @@
+"""Per-request overhead of the rate limit storages, and how many hits they let through across processes.
+
+    python benchmarks/ratelimit_bench.py [--requests 2000] [--workers 4]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from flask_limiter import Limiter  # noqa: E402
+from flask_limiter.util import get_remote_address  # noqa: E402
+from limits import parse  # noqa: E402
+from limits.storage import storage_from_string  # noqa: E402
+from limits.strategies import MovingWindowRateLimiter  # noqa: E402
+import ratelimit  # noqa: E402,F401
+
+
+def build_app(storage_uri):
+    app = Flask(__name__)
+    app.config['RATELIMIT_STRATEGY'] = 'moving-window'
+    if storage_uri:
+        app.config['RATELIMIT_STORAGE_URI'] = storage_uri
+    limiter = Limiter(key_func=get_remote_address, app=app, enabled=storage_uri is not None)
+
+    @app.route('/')
+    @limiter.limit("1000000 per hour")
+    def index():
+        return 'ok'
+
+    # The limit decorator only holds a weak reference to the limiter.
+    app.limiter = limiter
+    return app
+
+
+def time_requests(storage_uri, count):
+    client = build_app(storage_uri).test_client()
+    for _ in range(50):
+        client.get('/')
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        client.get('/')
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return {
+        'mean_us': round(statistics.fmean(samples), 1),
+        'p50_us': round(samples[len(samples) // 2], 1),
+        'p99_us': round(samples[int(len(samples) * 0.99)], 1),
+    }
+
+
+def hammer(storage_uri, limit, attempts, results):
+    storage = storage_from_string(storage_uri)
+    strategy = MovingWindowRateLimiter(storage)
+    item = parse(f"{limit} per hour")
+    results.put(sum(strategy.hit(item, 'shared-client') for _ in range(attempts)))
+
+
+def accepted_across_processes(storage_uri, workers, limit):
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=hammer, args=(storage_uri, limit, limit, results))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return sum(results.get() for _ in processes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    backends = {
+        'disabled': None,
+        'memory': 'memory://',
+        'sqlite': f'sqlite:///{directory}/latency.db',
+    }
+    report = {'requests': args.requests, 'latency': {}, 'overhead_us': {}}
+    for name, uri in backends.items():
+        report['latency'][name] = time_requests(uri, args.requests)
+    for name in ('memory', 'sqlite'):
+        report['overhead_us'][name] = round(report['latency'][name]['mean_us']
+                                            - report['latency']['disabled']['mean_us'], 1)
+
+    # Each process stands in for a gunicorn worker hitting the same limit for the same client.
+    report['accepted'] = {
+        'limit': args.limit,
+        'workers': args.workers,
+        'memory': accepted_across_processes('memory://', args.workers, args.limit),
+        'sqlite': accepted_across_processes(f'sqlite:///{directory}/shared.db', args.workers, args.limit),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+"""Latency, throughput, SQL queries and peak memory of every route, against a synthetic SQLite database.
+
+    python benchmarks/routes_bench.py [--users 200] [--posts 500] [--comments 10] [--ratings 5]
+                                      [--requests 100] [--routes show_post,user] [--page-cache none]
+                                      [--output results.json] [--compare baseline.json]
+
+Runs offline: the outbox sender is off so nothing is emailed or texted, reCAPTCHA always passes, and rate limits
+and CSRF checks are disabled. Results are written as JSON (benchmarks/results/ by default) so runs can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+class Scenario:
+    # `build(count)` runs in an app context and returns `count` (method, path, form data) requests, so write
+    # scenarios can look up the rows they act on. `relogin` restores the session before every request.
+    def __init__(self, name, user, build, limit=None, relogin=False):
+        self.name = name
+        self.user = user
+        self.build = build
+        self.limit = limit
+        self.relogin = relogin
+
+
+def cycle(values, count):
+    return [values[index % len(values)] for index in range(count)]
+
+
+def scenarios(summary, ids):
+    from extensions import db
+    from models.models import BlogPost, Comment, Rating
+
+    posts = summary['posts']
+    admin, author, reader = ids['admin'], ids['author'], ids['reader']
+    writer, requester = ids['writer'], ids['requester']
+
+    def own(model, user_id):
+        return db.session.execute(db.select(model.id).where(model.author_id == user_id)
+                                  .order_by(model.id)).scalars().all()
+
+    def created_posts():
+        return db.session.execute(db.select(BlogPost.id, BlogPost.title).where(BlogPost.title.like('Benchmark post %'))
+                                  .order_by(BlogPost.id)).all()
+
+    def get(path):
+        return lambda count: [('GET', path, None)] * count
+
+    post_form = {'subtitle': 'A post written by the benchmark', 'img_url': 'https://picsum.photos/1920/1080',
+                 'body': '<p>Benchmark <strong>body</strong> with a <a href="https://example.com">link</a>.</p>' * 20,
+                 'submit': 'Submit Post'}
+    return [
+        Scenario('index', None, get('/')),
+        Scenario('index_logged_in', reader, get('/')),
+        Scenario('index_page_5', None, lambda count: [('GET', f'/?after={posts - 4 * 10 + 1}', None)] * count),
+        Scenario('show_post', None, lambda count: [('GET', f'/post/{post_id}', None)
+                                                   for post_id in cycle(range(1, posts + 1), count)]),
+        Scenario('show_post_logged_in', reader, lambda count: [('GET', f'/post/{post_id}', None)
+                                                               for post_id in cycle(range(1, posts + 1), count)]),
+        Scenario('search', None, lambda count: [('GET', f'/search?q={term}', None)
+                                                for term in cycle(['tomato', 'flask cache', 'kernel thread'], count)]),
+        Scenario('user', reader, get('/user')),
+        Scenario('about', None, get('/about')),
+        Scenario('error', None, get('/error')),
+        Scenario('contact', None, get('/contact')),
+        Scenario('login_form', None, get('/login')),
+        Scenario('register_form', None, get('/register')),
+        Scenario('new_post_form', author, get('/new-post')),
+        Scenario('request_posting_form', requester, get('/request-posting')),
+        Scenario('permission', admin, get('/permission')),
+        Scenario('cache_stats', admin, get('/cache-stats')),
+        Scenario('recaptcha_stats', admin, get('/recaptcha-stats')),
+        # Writes, each request acting on its own row.
+        Scenario('add_comment', writer, lambda count: [
+            ('POST', f'/post/{post_id}', {'comment': '<p>A benchmark comment.</p>', 'submit': 'Submit Comment'})
+            for post_id in range(1, count + 1)], limit=posts),
+        Scenario('edit_comment_form', writer, lambda count: [('GET', f'/edit-comment/{comment_id}', None)
+                                                             for comment_id in cycle(own(Comment, writer), count)]),
+        Scenario('edit_comment', writer, lambda count: [
+            ('POST', f'/edit-comment/{comment_id}',
+             {'comment': '<p>An edited comment.</p>', 'submit': 'Submit Comment'})
+            for comment_id in cycle(own(Comment, writer), count)]),
+        Scenario('delete_comment', writer, lambda count: [('GET', f'/delete-comment/{comment_id}', None)
+                                                          for comment_id in own(Comment, writer)[:count]]),
+        Scenario('add_rating', writer, lambda count: [
+            ('POST', f'/post/{post_id}', {'rating': '7', 'submit': 'Submit Rating'})
+            for post_id in range(1, count + 1)], limit=posts),
+        Scenario('edit_rating', writer, lambda count: [
+            ('POST', f'/edit-rating/{rating_id}', {'rating': '4', 'submit': 'Submit Rating'})
+            for rating_id in cycle(own(Rating, writer), count)]),
+        Scenario('delete_rating', writer, lambda count: [('GET', f'/delete-rating/{rating_id}', None)
+                                                         for rating_id in own(Rating, writer)[:count]]),
+        Scenario('new_post', author, lambda count: [
+            ('POST', '/new-post', dict(post_form, title=f'Benchmark post {index}')) for index in range(count)]),
+        Scenario('edit_post_form', admin, lambda count: [('GET', f'/edit-post/{post_id}', None)
+                                                         for post_id in cycle(range(1, posts + 1), count)]),
+        Scenario('edit_post', admin, lambda count: [
+            ('POST', f'/edit-post/{post_id}', dict(post_form, title=title))
+            for post_id, title in cycle(created_posts(), count)]),
+        Scenario('delete_post', admin, lambda count: [('GET', f'/delete/{post_id}', None)
+                                                      for post_id, _ in created_posts()[:count]]),
+        Scenario('request_posting', requester, lambda count: [
+            ('POST', '/request-posting', {'reason': 'I would like to write', 'g-recaptcha-response': 'x',
+                                          'submit': 'Submit Request'})] * count),
+        Scenario('process_posting', admin, lambda count: [
+            ('GET', f'/process-posting/{requester}/{index % 2}', None) for index in range(count)]),
+        Scenario('contact_send', reader, lambda count: [
+            ('POST', '/contact', {'name': 'Reader', 'phone': '555 0100', 'email': 'reader@example.com',
+                                  'message': 'Hello from the benchmark', 'g-recaptcha-response': 'x'})] * count),
+        # Password hashing dominates these, a few requests are enough.
+        Scenario('register', None, lambda count: [
+            ('POST', '/register', {'email': f'new{index}@example.com', 'name': 'New', 'password': 'Benchmark-123!',
+                                   'confirm_password': 'Benchmark-123!', 'submit': 'Register'})
+            for index in range(count)], limit=10, relogin=True),
+        Scenario('login', None, lambda count: [
+            ('POST', '/login', {'email': f'user{reader}@example.com', 'password': 'benchmark-password',
+                                'submit': 'Login'})] * count, limit=10, relogin=True),
+        Scenario('logout', reader, get('/logout'), relogin=True),
+    ]
+
+
+def percentile(samples, fraction):
+    return round(samples[min(len(samples) - 1, int(fraction * len(samples)))] * 1000, 3)
+
+
+def run_scenario(app, scenario, counter, warmup, memory_samples, requests):
+    from extensions import db
+
+    total = warmup + memory_samples + requests
+    if scenario.limit is not None:
+        total = min(total, scenario.limit)
+    with app.app_context():
+        calls = scenario.build(total)
+        db.session.remove()
+    if not calls:
+        return {'skipped': 'no rows to act on'}
+
+    client = app.test_client()
+
+    def login():
+        with client.session_transaction() as session:
+            session.clear()
+            if scenario.user is not None:
+                session['_user_id'] = str(scenario.user)
+                session['_fresh'] = True
+
+    login()
+    # Small scenarios keep at least half of their requests for timing.
+    warmup = min(warmup, len(calls) // 4)
+    memory_samples = min(memory_samples, len(calls) // 4)
+    latencies, queries, statuses = [], [], Counter()
+    peak = 0
+    timed_start = None
+    for index, (method, path, data) in enumerate(calls):
+        if scenario.relogin:
+            login()
+        measuring_memory = warmup <= index < warmup + memory_samples
+        timed = index >= warmup + memory_samples
+        if measuring_memory:
+            tracemalloc.start()
+        if timed and timed_start is None:
+            timed_start = time.perf_counter()
+        counter['queries'] = 0
+        start = time.perf_counter()
+        response = client.open(path, method=method, data=data)
+        elapsed = time.perf_counter() - start
+        if measuring_memory:
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        if timed:
+            latencies.append(elapsed)
+            queries.append(counter['queries'])
+            statuses[response.status_code] += 1
+    duration = time.perf_counter() - timed_start if timed_start else 0
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'status': dict(sorted(statuses.items())),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'p50_ms': percentile(latencies, 0.5),
+        'p90_ms': percentile(latencies, 0.9),
+        'p99_ms': percentile(latencies, 0.99),
+        'max_ms': percentile(latencies, 1.0),
+        'throughput_rps': round(len(latencies) / duration, 1) if duration else None,
+        'queries_mean': round(sum(queries) / len(queries), 2),
+        'queries_max': max(queries),
+        'peak_memory_kib': round(peak / 1024, 1) if memory_samples else None,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline_path):
+    with open(baseline_path) as file:
+        baseline = json.load(file)['routes']
+    print(f"{'route':<24}{'p50 ms':>22}{'p99 ms':>22}{'queries':>16}", file=sys.stderr)
+    for name, result in report['routes'].items():
+        before = baseline.get(name)
+        if 'p50_ms' not in result or not before or 'p50_ms' not in before:
+            continue
+
+        def change(key):
+            delta = (result[key] - before[key]) / before[key] * 100 if before[key] else 0
+            return f"{before[key]} -> {result[key]} ({delta:+.0f}%)"
+
+        print(f"{name:<24}{change('p50_ms'):>22}{change('p99_ms'):>22}"
+              f"{str(before['queries_mean']) + ' -> ' + str(result['queries_mean']):>16}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--posts', type=int, default=500)
+    parser.add_argument('--comments', type=int, default=10, help="comments per post")
+    parser.add_argument('--ratings', type=int, default=5, help="ratings per post")
+    parser.add_argument('--paragraphs', type=int, default=8, help="paragraphs per post body")
+    parser.add_argument('--requests', type=int, default=100, help="timed requests per route")
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--memory-samples', type=int, default=5)
+    parser.add_argument('--routes', help="comma separated scenario names to run, default all")
+    parser.add_argument('--page-cache', default='none', choices=['none', 'memory', 'filesystem'])
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output')
+    parser.add_argument('--compare', help="previous results to compare against")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='the-blog-bench-')
+    os.environ.update({
+        'DB_URI': f"sqlite:///{os.path.join(directory, 'bench.db')}",
+        'F_KEY': os.environ.get('F_KEY', 'benchmark'),
+        'OUTBOX_WORKER': 'off',
+        'PAGE_CACHE_BACKEND': args.page_cache,
+        'PAGE_CACHE_DIR': os.path.join(directory, 'page-cache'),
+        'RATELIMIT_STORAGE_URI': 'memory://',
+    })
+
+    from sqlalchemy import event
+    from werkzeug.security import generate_password_hash
+    from app import create_app
+    from extensions import db, limiter, recaptcha
+    from outbox import outbox
+    from models.models import UserBlog
+    import dataset
+
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    limiter.enabled = False
+    recaptcha.verify = lambda recaptcha_response, remote_ip=None: True
+
+    class NoSMS:
+        def send(self, body):
+            pass
+
+    outbox.sms_transport = NoSMS()
+
+    with app.app_context():
+        start = time.perf_counter()
+        summary = dataset.seed(args.users, args.posts, args.comments, args.ratings, args.paragraphs, args.seed)
+        summary['seconds'] = round(time.perf_counter() - start, 2)
+        # Users with no comments or ratings yet, for the write scenarios.
+        writer, requester = args.users + 1, args.users + 2
+        db.session.add_all([UserBlog(id=user_id, email=f"user{user_id}@example.com", name=f"User {user_id}",
+                                     password=generate_password_hash(dataset.PASSWORD),
+                                     add_post=False, request=False) for user_id in (writer, requester)])
+        db.session.commit()
+        counter = Counter()
+        event.listen(db.engine, 'before_cursor_execute', lambda *_: counter.update(queries=1))
+
+    ids = {'admin': 1, 'author': 2, 'reader': min(11, args.users), 'writer': writer, 'requester': requester}
+    selected = set(args.routes.split(',')) if args.routes else None
+    report = {
+        'meta': {
+            'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'page_cache': args.page_cache,
+            'requests': args.requests,
+            'warmup': args.warmup,
+            'dataset': summary,
+        },
+        'routes': {},
+    }
+    for scenario in scenarios(summary, ids):
+        if selected and scenario.name not in selected:
+            continue
+        result = run_scenario(app, scenario, counter, args.warmup, args.memory_samples, args.requests)
+        report['routes'][scenario.name] = result
+        print(f"{scenario.name:<24}" + (f"p50 {result['p50_ms']:>8} ms  p99 {result['p99_ms']:>8} ms  "
+                                         f"{result['queries_mean']:>6} queries  {result['status']}"
+                                         if 'p50_ms' in result else result['skipped']), file=sys.stderr)
+
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results',
+                                         f"routes-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Saved {output}", file=sys.stderr)
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""Concurrent comment/rating writes and post reads from several worker processes against one SQLite file.
+
+    python benchmarks/sqlite_stress.py [--workers 8] [--seconds 10] [--write-ratio 0.3] [--posts 200]
+
+Each process stands in for a gunicorn worker and runs what the comment, rating and post routes do through
+models.transactions (get_post_with_comments, touch_post, adjust_rating_totals, add), without rendering, so the
+database is the bottleneck. The same workload runs twice on copies of one seeded database: with SQLite's defaults
+and no lock retries, as before the production profile, and with the profile (WAL, synchronous=NORMAL,
+busy_timeout, mmap and cache sizing, retry-on-lock). Writes that never got stored and reads that failed are
+counted, and rating totals are checked against the ratings table afterwards.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PROFILES = {
+    'defaults': {'SQLITE_PRAGMAS': 'false', 'SQLITE_LOCK_RETRIES': '0'},
+    'production': {'SQLITE_PRAGMAS': 'true', 'SQLITE_LOCK_RETRIES': '3'},
+}
+
+
+def environment(database, profile):
+    return dict(PROFILES[profile], DB_URI=f"sqlite:///{database}", F_KEY='benchmark', OUTBOX_WORKER='off',
+                PAGE_CACHE_BACKEND='none', RATELIMIT_STORAGE_URI='memory://')
+
+
+def prepare(database, posts, writers):
+    # Seeded once with the rollback journal, then copied for each profile.
+    os.environ.update(environment(database, 'defaults'))
+    from app import create_app
+    from extensions import db
+    from models.models import UserBlog
+    import dataset
+
+    app = create_app()
+    with app.app_context():
+        summary = dataset.seed(users=20, posts=posts, comments_per_post=3, ratings_per_post=3, paragraphs=4)
+        db.session.execute(db.insert(UserBlog), [
+            {'id': user_id, 'email': f"writer{user_id}@example.com", 'name': f"Writer {user_id}",
+             'password': 'x', 'add_post': False, 'request': False} for user_id in writers])
+        db.session.commit()
+        db.engine.dispose()
+    return summary
+
+
+def worker(database, profile, user_id, posts, seconds, write_ratio, start, results):
+    os.environ.update(environment(database, profile))
+    from sqlalchemy import event
+    from app import create_app
+    from extensions import db
+    from models.models import Comment, Rating
+    from models.transactions import DatabaseError, get_feed, get_post_with_comments, adjust_rating_totals, \
+        touch_post, add
+
+    app = create_app()
+    lock_errors = []
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'handle_error', lambda context: lock_errors.append(
+                'locked' in str(context.original_exception).lower()))
+
+    rng = random.Random(user_id)
+    targets = list(range(1, posts + 1))
+    rng.shuffle(targets)
+    pending = [('comment', post_id) for post_id in targets] + [('rating', post_id) for post_id in targets]
+    attempted = {'comment': 0, 'rating': 0}
+    reads, writes, failed_reads = [], [], 0
+    start.wait()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        writing = bool(pending) and rng.random() < write_ratio
+        began = time.perf_counter()
+        # A request context per operation, as in the app: its own session, removed at teardown.
+        with app.test_request_context():
+            try:
+                if writing:
+                    kind, post_id = pending.pop(0)
+                    attempted[kind] += 1
+                    post = get_post_with_comments(post_id)
+                    touch_post(post)
+                    if kind == 'comment':
+                        add(Comment(text='<p>A stress comment.</p>', author_id=user_id, post_id=post_id))
+                    else:
+                        rating = Rating(value=float(rng.randint(0, 10)), author_id=user_id, post_id=post_id)
+                        adjust_rating_totals(post, 1, rating.value)
+                        add(rating)
+                elif rng.random() < 0.3:
+                    get_feed(limit=10)
+                else:
+                    post = get_post_with_comments(rng.randint(1, posts))
+                    [comment.comment_author.name for comment in post.comments]
+            except DatabaseError:
+                # Failed writes are counted from what was stored.
+                failed_reads += not writing
+        (writes if writing else reads).append(time.perf_counter() - began)
+    results.put({'user_id': user_id, 'reads': reads, 'writes': writes, 'failed_reads': failed_reads,
+                 'attempted': attempted, 'lock_errors': sum(lock_errors)})
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return round(samples[min(len(samples) - 1, int(fraction * len(samples)))] * 1000, 1) if samples else None
+
+
+def run(database, profile, writers, args):
+    context = multiprocessing.get_context('spawn')
+    start = context.Event()
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(database, profile, user_id, args.posts, args.seconds,
+                                                      args.write_ratio, start, results)) for user_id in writers]
+    for process in processes:
+        process.start()
+    # Give every worker time to import the app before the clock starts.
+    time.sleep(args.startup)
+    start.set()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    connection = sqlite3.connect(database)
+    placeholders = ','.join('?' * len(writers))
+    stored_comments = connection.execute(f"SELECT COUNT(*) FROM comments WHERE author_id IN ({placeholders})",
+                                         writers).fetchone()[0]
+    stored_ratings = connection.execute(f"SELECT COUNT(*) FROM ratings WHERE author_id IN ({placeholders})",
+                                        writers).fetchone()[0]
+    mismatched_totals = connection.execute(
+        "SELECT COUNT(*) FROM blog_posts p WHERE p.rating_count != "
+        "(SELECT COUNT(*) FROM ratings r WHERE r.post_id = p.id)").fetchone()[0]
+    journal_mode = connection.execute("PRAGMA journal_mode").fetchone()[0]
+    connection.close()
+
+    reads = [sample for outcome in outcomes for sample in outcome['reads']]
+    writes = [sample for outcome in outcomes for sample in outcome['writes']]
+    attempted = sum(sum(outcome['attempted'].values()) for outcome in outcomes)
+    return {
+        'journal_mode': journal_mode,
+        'requests_per_second': round((len(reads) + len(writes)) / args.seconds, 1),
+        'reads': len(reads),
+        'read_p50_ms': percentile(reads, 0.5),
+        'read_p99_ms': percentile(reads, 0.99),
+        'failed_reads': sum(outcome['failed_reads'] for outcome in outcomes),
+        'writes': attempted,
+        'write_p50_ms': percentile(writes, 0.5),
+        'write_p99_ms': percentile(writes, 0.99),
+        'lost_writes': attempted - stored_comments - stored_ratings,
+        'lock_errors': sum(outcome['lock_errors'] for outcome in outcomes),
+        'mismatched_rating_totals': mismatched_totals,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.3)
+    parser.add_argument('--posts', type=int, default=200)
+    parser.add_argument('--startup', type=float, default=5, help="seconds allowed for the workers to start")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='the-blog-sqlite-stress-')
+    seeded = os.path.join(directory, 'seeded.db')
+    writers = list(range(1001, 1001 + args.workers))
+    report = {'workers': args.workers, 'seconds': args.seconds, 'write_ratio': args.write_ratio,
+              'dataset': prepare(seeded, args.posts, writers), 'profiles': {}}
+    for profile in PROFILES:
+        database = os.path.join(directory, f'{profile}.db')
+        shutil.copy(seeded, database)
+        report['profiles'][profile] = run(database, profile, writers, args)
+        print(f"{profile:<12}{json.dumps(report['profiles'][profile])}", file=sys.stderr)
+    print(json.dumps(report, indent=2))
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from datetime import timezone
+from functools import wraps
+from flask import current_app, g, request, session, make_response, Response
+from flask_login import current_user
+
+
+class MemoryBackend:
+    # Per-process LRU, invalidations are only seen by the worker that made them.
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def generation(self, namespace):
+        return self._generations.get(namespace, 0)
+
+    def get(self, namespace, generation, key):
+        with self._lock:
+            entry = self._entries.get((namespace, generation, key))
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[(namespace, generation, key)]
+                return None
+            self._entries.move_to_end((namespace, generation, key))
+            return entry[1], entry[2]
+
+    def set(self, namespace, generation, key, body, mimetype, ttl):
+        with self._lock:
+            self._entries[(namespace, generation, key)] = (time.time() + ttl, body, mimetype)
+            self._entries.move_to_end((namespace, generation, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, namespace):
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            for entry_key in [entry_key for entry_key in self._entries if entry_key[0] == namespace]:
+                del self._entries[entry_key]
+
+
+class FileSystemBackend:
+    # Shared by every worker pointing at the same directory. Each namespace has a marker file whose
+    # mtime is its generation, so an invalidation from any worker hides entries written before it.
+    # Every SWEEP_EVERY writes a worker drops the expired entries and the oldest beyond max_entries.
+    SWEEP_EVERY = 32
+
+    def __init__(self, directory, max_entries=256):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _namespace_dir(self, namespace):
+        return os.path.join(self.directory, namespace)
+
+    def _entry_path(self, namespace, generation, key):
+        return os.path.join(self._namespace_dir(namespace), str(generation),
+                            hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def generation(self, namespace):
+        try:
+            return os.stat(os.path.join(self._namespace_dir(namespace), 'GENERATION')).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def get(self, namespace, generation, key):
+        try:
+            with open(self._entry_path(namespace, generation, key), 'rb') as entry:
+                expires, mimetype = entry.readline().decode('utf-8').split(' ', 1)
+                if float(expires) < time.time():
+                    return None
+                return entry.read(), mimetype.strip()
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def set(self, namespace, generation, key, body, mimetype, ttl):
+        path = self._entry_path(namespace, generation, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as entry:
+            entry.write(f"{time.time() + ttl} {mimetype}\n".encode('utf-8'))
+            entry.write(body)
+        os.replace(temp_path, path)
+        with self._lock:
+            self._writes += 1
+            sweep = self._writes % self.SWEEP_EVERY == 0
+        if sweep:
+            self.sweep()
+
+    def sweep(self):
+        now = time.time()
+        entries = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name == 'GENERATION' or name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    with open(path, 'rb') as entry:
+                        expires = float(entry.readline().split(b' ', 1)[0])
+                    if expires < now:
+                        os.remove(path)
+                    else:
+                        entries.append((os.stat(path).st_mtime_ns, path))
+                except (OSError, ValueError):
+                    continue
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_entries)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def invalidate(self, namespace):
+        namespace_dir = self._namespace_dir(namespace)
+        os.makedirs(namespace_dir, exist_ok=True)
+        marker = os.path.join(namespace_dir, 'GENERATION')
+        with open(marker, 'a'):
+            pass
+        os.utime(marker, ns=(time.time_ns(), time.time_ns()))
+        current = str(self.generation(namespace))
+        for name in os.listdir(namespace_dir):
+            if name not in ('GENERATION', current):
+                shutil.rmtree(os.path.join(namespace_dir, name), ignore_errors=True)
+
+
+class PageCache:
+    def __init__(self):
+        self.backend = None
+        self.ttl = 300
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        backend = app.config.get('PAGE_CACHE_BACKEND', 'memory')
+        self.ttl = app.config.get('PAGE_CACHE_TTL', 300)
+        if backend == 'memory':
+            self.backend = MemoryBackend(app.config.get('PAGE_CACHE_SIZE', 256))
+        elif backend == 'filesystem':
+            self.backend = FileSystemBackend(app.config['PAGE_CACHE_DIR'], app.config.get('PAGE_CACHE_SIZE', 256))
+        elif backend in (None, 'none'):
+            self.backend = None
+        else:
+            raise ValueError(f"Unsupported page cache backend: {backend}")
+        app.extensions['page_cache'] = self
+
+    def cached(self, namespace, query_args=None):
+        # Caches logged-out GET responses of the decorated view under a namespace, either a string or a
+        # function of the view arguments, so write paths can drop every page depending on a record. Only the
+        # query arguments the view reads, `query_args` mapping their names to types, are part of the key, so
+        # arbitrary query strings do not multiply the entries. Under @conditional the entries are also keyed
+        # on the validator's tag: invalidations only reach the worker that made them, and a worker must not
+        # serve a body older than the ETag it is sent with.
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                if not self._cacheable():
+                    return f(*args, **kwargs)
+
+                name = namespace(**kwargs) if callable(namespace) else namespace
+                generation = self.backend.generation(name)
+                values = sorted((argument, request.args.get(argument, type=kind))
+                                for argument, kind in (query_args or {}).items())
+                key = f"{g.get('validator_tag', '')}|{request.path}|{values}"
+                entry = self.backend.get(name, generation, key)
+                if entry is not None:
+                    self._count('hits')
+                    response = Response(entry[0], mimetype=entry[1])
+                    response.headers['X-Page-Cache'] = 'HIT'
+                    response.vary.add('Cookie')
+                    return response
+
+                self._count('misses')
+                response = make_response(f(*args, **kwargs))
+                if response.status_code == 200 and not response.direct_passthrough:
+                    self.backend.set(name, generation, key, response.get_data(), response.mimetype, self.ttl)
+                    response.headers['X-Page-Cache'] = 'MISS'
+                    response.vary.add('Cookie')
+                return response
+
+            return decorated_function
+
+        return decorator
+
+    def invalidate_index(self):
+        if self.backend is not None:
+            self.backend.invalidate('index')
+
+    def invalidate_post(self, post_id):
+        if self.backend is not None:
+            self.backend.invalidate(f'post-{post_id}')
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__ if self.backend is not None else None,
+            'pid': os.getpid(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _cacheable(self):
+        return (self.backend is not None
+                and request.method == 'GET'
+                and not current_user.is_authenticated
+                and not session.get('_flashes'))
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+def conditional(validator):
+    # Adds a strong ETag and Last-Modified to GET responses of the decorated view and answers matching
+    # conditional requests with a 304 before the view runs. validator receives the view arguments and
+    # returns (tag, last_modified) describing the current version of the page, or None to skip.
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method != 'GET' or session.get('_flashes'):
+                return f(*args, **kwargs)
+
+            state = validator(**kwargs)
+            if state is None:
+                return f(*args, **kwargs)
+
+            g.validator_tag = state[0]
+            etag = _etag(state[0])
+            last_modified = state[1]
+            if last_modified is not None and last_modified.tzinfo is None:
+                last_modified = last_modified.replace(tzinfo=timezone.utc)
+
+            if _not_modified(etag, last_modified):
+                response = Response(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            if current_user.is_authenticated:
+                response.cache_control.private = True
+            else:
+                response.cache_control.public = True
+            response.vary.add('Cookie')
+            return response
+
+        return decorated_function
+
+    return decorator
+
+
+def _etag(tag):
+    # The viewer is part of the validator so a page rendered for one login state is never reused for
+    # another. Logged-in pages carry CSRF tokens, so they are also rotated once per token lifetime.
+    if current_user.is_authenticated:
+        viewer = f"user-{current_user.id}-{current_user.add_post}-{current_user.request}"
+        token_lifetime = current_app.config.get('WTF_CSRF_TIME_LIMIT', 3600)
+        if token_lifetime:
+            viewer += f"-{int(time.time() // token_lifetime)}"
+    else:
+        viewer = 'anonymous'
+    return hashlib.sha1(f"{tag}|{request.full_path}|{viewer}".encode('utf-8')).hexdigest()
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since and not current_user.is_authenticated:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
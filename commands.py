@@ -0,0 +1,156 @@
+import os
+import click
+import requests
+from flask import current_app
+from flask.cli import with_appcontext
+from werkzeug.security import generate_password_hash
+from models.schema import upgrade_schema
+from models.transactions import recompute_rating_totals, backfill_avatar_hashes, put, DatabaseError
+from utils import avatar_hash
+from outbox import outbox
+from search import search_index
+from images import images, build_images
+from assets import assets, vendor_assets, build_assets
+from importer import Importer
+from exporter import export_records, ndjson
+from models.models import UserBlog
+from extensions import db
+
+
+@click.command('upgrade-db')
+@with_appcontext
+def upgrade_db_command():
+    """Add the columns and indexes introduced since the database was created."""
+    try:
+        applied = upgrade_schema()
+    except DatabaseError as e:
+        raise click.ClickException(e.message)
+    for change in applied:
+        click.echo(f"Added {change}")
+    click.echo(f"Schema up to date ({len(applied)} change(s) applied).")
+
+
+@click.command('recompute-ratings')
+@with_appcontext
+def recompute_ratings_command():
+    """Rebuild the stored rating totals of every post from the ratings table."""
+    updated = recompute_rating_totals()
+    click.echo(f"Recomputed rating totals for {updated} post(s).")
+
+
+@click.command('backfill-avatars')
+@with_appcontext
+def backfill_avatars_command():
+    """Store the gravatar hash of users registered before it was precomputed."""
+    updated = backfill_avatar_hashes(avatar_hash)
+    click.echo(f"Stored avatar hashes for {updated} user(s).")
+
+
+@click.command('outbox-worker')
+@click.option('--once', is_flag=True, help="Deliver what is due and exit instead of polling.")
+@with_appcontext
+def outbox_worker_command(once):
+    """Deliver queued email and SMS, for deployments running with OUTBOX_WORKER=off."""
+    outbox.run(once=once)
+
+
+@click.command('rebuild-search')
+@with_appcontext
+def rebuild_search_command():
+    """Rebuild the full-text search index from the posts table."""
+    try:
+        indexed = search_index.rebuild()
+    except DatabaseError as e:
+        raise click.ClickException(e.message)
+    click.echo(f"Indexed {indexed} post(s) ({search_index.backend.name}).")
+
+
+@click.command('build-images')
+@with_appcontext
+def build_images_command():
+    """Write resized, recompressed and content-hashed variants of the page header images."""
+    try:
+        manifest = build_images(images.source_dir, images.output_dir)
+    except ImportError:
+        raise click.ClickException("Pillow is required to build images: pip install Pillow")
+    images.load()
+    variants = sum(len(formats) for widths in manifest.values() for formats in widths.values())
+    click.echo(f"Wrote {variants} variant(s) of {len(manifest)} image(s) to {images.output_dir}.")
+
+
+@click.command('vendor-assets')
+@with_appcontext
+def vendor_assets_command():
+    """Download the third-party CSS, JS and fonts the pages use into static/vendor."""
+    try:
+        written = vendor_assets(current_app.static_folder)
+    except requests.RequestException as e:
+        raise click.ClickException(f"Download failed: {e}")
+    for path in written:
+        click.echo(f"Wrote {path}")
+
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command():
+    """Bundle, minify, hash and precompress the stylesheets, scripts and CKEditor."""
+    try:
+        ckeditor_folder = os.path.join(current_app.blueprints['ckeditor'].static_folder,
+                                       current_app.config['CKEDITOR_PKG_TYPE'])
+        manifest = build_assets(current_app.static_folder, assets.output_dir, ckeditor_folder)
+    except FileNotFoundError as e:
+        raise click.ClickException(str(e))
+    assets.load()
+    for name in sorted(manifest):
+        click.echo(f"{name} -> {manifest[name]}")
+
+
+@click.command('import-posts')
+@click.argument('path', type=click.Path(exists=True))
+@click.option('--batch-size', default=500, show_default=True, help="Records per transaction.")
+@click.option('--author', help="Email of the author of posts that name none, default the admin.")
+@click.option('--checkpoint', type=click.Path(), help="Progress file for resuming, default PATH.import-checkpoint.json")
+@with_appcontext
+def import_posts_command(path, batch_size, author, checkpoint):
+    """Import users, posts, comments and ratings from JSON, NDJSON or Markdown files."""
+    if author is None:
+        admin = db.session.get(UserBlog, 1)
+        author = admin.email if admin else None
+    checkpoint = checkpoint or os.path.abspath(path).rstrip(os.sep) + '.import-checkpoint.json'
+    importer = Importer(batch_size=batch_size, default_author=author, checkpoint=checkpoint, progress=click.echo)
+    try:
+        summary = importer.run(path)
+    except ValueError as e:
+        raise click.ClickException(f"{e}\nFix the record and run the command again to resume.")
+    except DatabaseError as e:
+        raise click.ClickException(f"{e.message}\nRun the command again to resume.")
+    click.echo(f"Imported {summary['users']} user(s), {summary['posts']} post(s), {summary['comments']} comment(s) "
+               f"and {summary['ratings']} rating(s), skipped {summary['skipped']} already present, "
+               f"in {summary['seconds']}s ({summary['rows_per_second']} rows/s).")
+
+
+@click.command('set-password')
+@click.argument('email')
+@click.password_option()
+@with_appcontext
+def set_password_command(email, password):
+    """Set a user's password, e.g. for an author imported without one."""
+    user = db.session.execute(db.select(UserBlog).filter_by(email=email.lower().strip())).scalar_one_or_none()
+    if user is None:
+        raise click.ClickException(f"No user with the email {email}.")
+    user.password = generate_password_hash(password, method='pbkdf2:sha256', salt_length=8)
+    try:
+        put()
+    except DatabaseError as e:
+        raise click.ClickException(e.message)
+    click.echo(f"Password set for {user.email}.")
+
+
+@click.command('export-content')
+@click.argument('output', type=click.File('wb'), default='-')
+@click.option('--gzip', 'compress', is_flag=True, help="Gzip-compress the output.")
+@with_appcontext
+def export_content_command(output, compress):
+    """Write every user, post, comment and rating as NDJSON, readable by import-posts."""
+    for chunk in ndjson(export_records(), compress=compress):
+        output.write(chunk)
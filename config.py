@@ -1,13 +1,45 @@
 import os
+import tempfile
+
+
+def engine_options(uri):
+    options = {
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', 'True').lower() in ('true', '1', 't'),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+    }
+    # Pool sizing only applies to the server databases' QueuePool, the pools SQLAlchemy picks for SQLite
+    # (StaticPool for in-memory databases) reject these arguments.
+    if not uri.startswith('sqlite'):
+        options.update({
+            'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+            'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+            'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        })
+    return options
 
 
 class Config:
     SECRET_KEY = os.environ.get('F_KEY')
     SQLALCHEMY_DATABASE_URI = os.environ.get("DB_URI", "sqlite:///posts.db")
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    # Comma separated replica URIs, read helpers are spread over them. Writes always go to DB_URI.
+    SQLALCHEMY_BINDS = {f'replica-{number}': dict(engine_options(uri), url=uri) for number, uri in
+                        enumerate(filter(None, map(str.strip, os.environ.get('DB_REPLICA_URIS', '').split(','))), 1)}
+    REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 5))
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLITE_PRAGMAS = os.environ.get('SQLITE_PRAGMAS', 'True').lower() in ('true', '1', 't')
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))  # milliseconds
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))  # bytes
+    SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE', -64 * 1024))  # negative: KiB, positive: pages
+    SQLITE_LOCK_RETRIES = int(os.environ.get('SQLITE_LOCK_RETRIES', 3))
+    SQLITE_LOCK_BACKOFF = 0.05
     RECAPTCHA_SECRET_KEY = os.environ.get("G_KEY")
-    EMAIL_HOST = "smtp.gmail.com"
-    EMAIL_PORT = 587
+    EMAIL_HOST = os.environ.get('EMAIL_HOST', "smtp.gmail.com")
+    EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 587))
+    EMAIL_START_TLS = os.environ.get('EMAIL_START_TLS', 'True').lower() in ('true', '1', 't')
+    EMAIL_TIMEOUT = 30
     CKEDITOR_SERVE_LOCAL = True
     CKEDITOR_VERSION = '4.24.0-lts'
     EMAIL_USERNAME = os.environ.get("E_ID")
@@ -18,3 +50,43 @@ class Config:
     TWILIO_PHONE_NUMBER = os.environ.get('S_ID')
     RECIPIENT_PHONE_NUMBER = os.environ.get('T_ID')
     RECAPTCHA_SITE_KEY = os.environ.get("S_KEY")
+    RECAPTCHA_VERIFY_URL = os.environ.get('RECAPTCHA_VERIFY_URL', 'https://www.google.com/recaptcha/api/siteverify')
+    RECAPTCHA_CONNECT_TIMEOUT = 2
+    RECAPTCHA_READ_TIMEOUT = 3
+    RECAPTCHA_POOL_SIZE = 10
+    RECAPTCHA_FAIL_OPEN = os.environ.get('RECAPTCHA_FAIL_OPEN', 'False').lower() in ('true', '1', 't')
+    RECAPTCHA_BREAKER_THRESHOLD = 5
+    RECAPTCHA_BREAKER_RESET = 30
+    POSTS_PER_PAGE = int(os.environ.get('POSTS_PER_PAGE', 10))
+    FEED_SIZE = 20
+    DASHBOARD_PER_PAGE = int(os.environ.get('DASHBOARD_PER_PAGE', 20))
+    PERMISSION_PER_PAGE = 50
+    # Scheme and host written into the feed and sitemap, e.g. https://blog.example.com. Defaults to the request's.
+    SITE_URL = os.environ.get('SITE_URL')
+    PAGE_CACHE_BACKEND = os.environ.get('PAGE_CACHE_BACKEND', 'memory')
+    PAGE_CACHE_DIR = os.environ.get('PAGE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'the-blog-page-cache'))
+    PAGE_CACHE_SIZE = int(os.environ.get('PAGE_CACHE_SIZE', 256))
+    PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL', 300))
+    OUTBOX_WORKER = os.environ.get('OUTBOX_WORKER', 'thread')
+    OUTBOX_POLL_INTERVAL = 30
+    OUTBOX_BATCH_SIZE = 50
+    OUTBOX_MAX_ATTEMPTS = 6
+    OUTBOX_RETRY_BASE = 30
+    OUTBOX_RETRY_MAX = 3600
+    OUTBOX_CLAIM_TIMEOUT = 600
+    RATELIMIT_STORAGE_URI = os.environ.get(
+        'RATELIMIT_STORAGE_URI', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'the-blog-ratelimit.db'))
+    RATELIMIT_STRATEGY = 'moving-window'
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 30))
+    USER_CACHE_SIZE = 1024
+    IMAGE_BUILD_DIR = os.environ.get(
+        'IMAGE_BUILD_DIR', os.path.join(os.path.dirname(__file__), 'static', 'build', 'img'))
+    ASSET_BUILD_DIR = os.environ.get(
+        'ASSET_BUILD_DIR', os.path.join(os.path.dirname(__file__), 'static', 'build', 'assets'))
+    SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION', 'False').lower() in ('true', '1', 't')
+    SQL_N_PLUS_ONE_THRESHOLD = int(os.environ.get('SQL_N_PLUS_ONE_THRESHOLD', 5))
+    PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', 'False').lower() in ('true', '1', 't')
+    PROFILER_SAMPLE_RATE = float(os.environ.get('PROFILER_SAMPLE_RATE', 0))
+    PROFILER_DIR = os.environ.get('PROFILER_DIR', os.path.join(tempfile.gettempdir(), 'the-blog-profiles'))
+    PROFILER_KEEP = 100
+    SMS_DIGEST_WINDOW = int(os.environ.get('SMS_DIGEST_WINDOW', 300))
@@ -0,0 +1,66 @@
+import html
+import json
+import zlib
+from datetime import datetime, timezone
+from sqlalchemy.orm import aliased
+from extensions import db
+from models.models import UserBlog, BlogPost, Comment, Rating
+
+FORMAT_VERSION = 1
+
+
+def export_records(batch_size=1000):
+    # Every user, post, comment and rating as import-posts records, parents before children. Rows are
+    # fetched `batch_size` at a time (a server-side cursor on PostgreSQL), so memory does not grow with the
+    # database. Fields the forms sanitize are exported as typed, import-posts sanitizes them again.
+    yield {'type': 'export', 'version': FORMAT_VERSION,
+           'created': datetime.now(timezone.utc).isoformat(timespec='seconds')}
+
+    users = db.select(UserBlog.email, UserBlog.name, UserBlog.password, UserBlog.add_post, UserBlog.request)
+    for row in stream(users.order_by(UserBlog.id), batch_size):
+        yield {'type': 'user', 'email': row.email, 'name': html.unescape(row.name or ''), 'password': row.password,
+               'add_post': bool(row.add_post), 'request': bool(row.request)}
+
+    posts = (db.select(BlogPost.title, BlogPost.subtitle, BlogPost.body, BlogPost.img_url, BlogPost.date,
+                       UserBlog.email.label('author'))
+             .outerjoin(UserBlog, BlogPost.author_id == UserBlog.id))
+    for row in stream(posts.order_by(BlogPost.id), batch_size):
+        yield {'type': 'post', 'title': html.unescape(row.title), 'subtitle': html.unescape(row.subtitle),
+               'body': row.body, 'img_url': html.unescape(row.img_url), 'date': row.date, 'author': row.author}
+
+    for model, field in ((Comment, Comment.text), (Rating, Rating.value)):
+        author = aliased(UserBlog)
+        children = (db.select(BlogPost.title.label('post'), author.email.label('author'), field)
+                    .join(BlogPost, model.post_id == BlogPost.id)
+                    .join(author, model.author_id == author.id))
+        kind = model.__name__.lower()
+        for row in stream(children.order_by(model.id), batch_size):
+            yield {'type': kind, 'post': html.unescape(row.post), 'author': row.author,
+                   field.key: getattr(row, field.key)}
+
+
+def stream(query, batch_size):
+    for partition in db.session.execute(query.execution_options(yield_per=batch_size)).partitions():
+        yield from partition
+
+
+def ndjson(records, compress=False, chunk_size=64 * 1024):
+    # The records as NDJSON bytes in chunks of about `chunk_size`, gzip-compressed on the fly if asked.
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buffer = []
+    size = 0
+    for record in records:
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+        buffer.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            data = b''.join(buffer)
+            buffer, size = [], 0
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+    data = b''.join(buffer)
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
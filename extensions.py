@@ -6,8 +6,12 @@ from flask_gravatar import Gravatar
 from flask_wtf.csrf import CSRFProtect
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+import ratelimit  # noqa: F401 registers the sqlite:// rate limit storage
+from cache import PageCache
+from recaptcha import RecaptchaVerifier
+from routing import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 ckeditor = CKEditor()
 bootstrap = Bootstrap5()
@@ -21,3 +25,6 @@ gravatar = Gravatar(size=100,
 csrf = CSRFProtect()
 limiter = Limiter(key_func=get_remote_address,
                   default_limits=["200 per day", "50 per hour"])
+
+page_cache = PageCache()
+recaptcha = RecaptchaVerifier()
@@ -0,0 +1,103 @@
+import html
+from datetime import datetime, timezone
+from xml.sax.saxutils import escape, quoteattr
+from flask import current_app, url_for
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models.models import SiteDocument, utcnow
+from models.transactions import DatabaseError, get_feed_state, get_site_document, get_feed_posts, get_post_dates, \
+    put
+
+MIMETYPES = {'feed.xml': 'application/atom+xml', 'sitemap.xml': 'application/xml'}
+
+
+def absolute_url(endpoint, **values):
+    # SITE_URL pins the host written into the stored documents, otherwise the requesting host is used.
+    site_url = current_app.config.get('SITE_URL')
+    if site_url:
+        return site_url.rstrip('/') + url_for(endpoint, **values)
+    return url_for(endpoint, _external=True, **values)
+
+
+def timestamp(value):
+    value = value or utcnow()
+    return value.replace(tzinfo=timezone.utc, microsecond=0).isoformat()
+
+
+def edited(post):
+    # Comments and ratings move updated_at, the feed only reports changes to the post itself.
+    return post.edited_at or post.updated_at
+
+
+def published(post):
+    # Posts only store their display date, e.g. "May 01, 2024".
+    try:
+        return timestamp(datetime.strptime(post.date, "%B %d, %Y"))
+    except (TypeError, ValueError):
+        return timestamp(edited(post))
+
+
+def text(value):
+    # Titles, subtitles and names are stored HTML-escaped.
+    return escape(html.unescape(value or ''))
+
+
+def build_feed(posts):
+    home = absolute_url('post.get_all_posts')
+    updated = max(filter(None, map(edited, posts)), default=None)
+    entries = []
+    for post in posts:
+        link = absolute_url('post.show_post', post_id=post.id)
+        author = post.author.name if post.author else 'The Blog'
+        entries.append(
+            f'<entry><id>{escape(link)}</id><title type="text">{text(post.title)}</title>'
+            f'<link rel="alternate" type="text/html" href={quoteattr(link)}/>'
+            f'<published>{published(post)}</published><updated>{timestamp(edited(post))}</updated>'
+            f'<author><name>{text(author)}</name></author>'
+            f'<summary type="text">{text(post.subtitle)}</summary>'
+            f'<content type="html">{escape(post.body)}</content></entry>')
+    return ('<?xml version="1.0" encoding="utf-8"?>\n'
+            '<feed xmlns="http://www.w3.org/2005/Atom">'
+            f'<id>{escape(home)}</id><title>The Blog</title><updated>{timestamp(updated)}</updated>'
+            f'<link rel="alternate" type="text/html" href={quoteattr(home)}/>'
+            f'<link rel="self" type="application/atom+xml" href={quoteattr(absolute_url("post.feed"))}/>'
+            + ''.join(entries) + '</feed>\n')
+
+
+def build_sitemap(posts):
+    urls = [f'<url><loc>{escape(absolute_url(endpoint))}</loc></url>'
+            for endpoint in ('post.get_all_posts', 'main.about', 'main.contact')]
+    for post_id, edited_at in posts:
+        urls.append(f'<url><loc>{escape(absolute_url("post.show_post", post_id=post_id))}</loc>'
+                    f'<lastmod>{timestamp(edited_at)}</lastmod></url>')
+    return ('<?xml version="1.0" encoding="utf-8"?>\n'
+            '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">' + ''.join(urls) + '</urlset>\n')
+
+
+def site_document(name):
+    # The stored document, rebuilt only when the feed version moved since it was built. Every write that adds,
+    # edits or removes a post bumps that version through touch_feed(), so the feed and the sitemap are rebuilt
+    # once per change to the posts rather than on every request. A rebuild regenerates the whole document from one
+    # query: the newest FEED_SIZE posts, or the id and edit time of every post.
+    state = get_feed_state()
+    version = state.version if state is not None else 0
+    document = get_site_document(name)
+    if document is not None and document.version == version:
+        return document.body
+
+    if name == 'feed.xml':
+        body = build_feed(get_feed_posts(current_app.config['FEED_SIZE']))
+    else:
+        body = build_sitemap(get_post_dates())
+    try:
+        if document is None:
+            db.session.add(SiteDocument(name=name, version=version, body=body, updated_at=utcnow()))
+        else:
+            document.version, document.body, document.updated_at = version, body, utcnow()
+        put()
+    except IntegrityError:
+        # Another worker stored the same version first.
+        pass
+    except DatabaseError as e:
+        current_app.logger.warning("Could not store %s: %s", name, e.message)
+    return body
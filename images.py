@@ -0,0 +1,129 @@
+import hashlib
+import html
+import io
+import json
+import os
+from flask import send_from_directory, url_for
+from markupsafe import Markup
+
+WIDTHS = (480, 960, 1440, 1920)
+# Best first: image-set() lets the browser take the first type it supports.
+FORMATS = (('avif', 'image/avif', {'quality': 50}),
+           ('webp', 'image/webp', {'quality': 72, 'method': 6}),
+           ('jpeg', 'image/jpeg', {'quality': 78, 'optimize': True, 'progressive': True}))
+EXTENSIONS = {'avif': 'avif', 'webp': 'webp', 'jpeg': 'jpg'}
+SOURCE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def build_images(source_dir, output_dir, widths=WIDTHS):
+    # Writes <name>-<width>.<hash>.<ext> for every width up to the original's and every format Pillow can
+    # encode, plus manifest.json mapping each source image to its variants. Returns the manifest.
+    from PIL import Image, ImageOps
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = {}
+    for filename in sorted(os.listdir(source_dir)):
+        if not filename.lower().endswith(SOURCE_EXTENSIONS):
+            continue
+        with Image.open(os.path.join(source_dir, filename)) as original:
+            image = ImageOps.exif_transpose(original).convert('RGB')
+        stem = os.path.splitext(filename)[0]
+        steps = [width for width in widths if width < image.width] + [min(image.width, max(widths))]
+        variants = {}
+        for width in sorted(set(steps)):
+            resized = image if width == image.width else \
+                image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+            variants[str(width)] = {}
+            for image_format, _, options in FORMATS:
+                buffer = io.BytesIO()
+                try:
+                    resized.save(buffer, image_format.upper(), **options)
+                except (KeyError, OSError):
+                    # Pillow built without this encoder.
+                    continue
+                data = buffer.getvalue()
+                name = f"{stem}-{width}.{hashlib.sha256(data).hexdigest()[:12]}.{EXTENSIONS[image_format]}"
+                path = os.path.join(output_dir, name)
+                if not os.path.exists(path):
+                    with open(path + '.tmp', 'wb') as file:
+                        file.write(data)
+                    os.replace(path + '.tmp', path)
+                variants[str(width)][image_format] = name
+        manifest[filename] = variants
+
+    with open(os.path.join(output_dir, 'manifest.json.tmp'), 'w') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(os.path.join(output_dir, 'manifest.json.tmp'), os.path.join(output_dir, 'manifest.json'))
+    return manifest
+
+
+def css_url(url):
+    # url("...") safe inside a <style> element: no way to close the string or the element.
+    escaped = ''.join(f'\\{ord(char):x} ' if char in '"\\<>\n\r' else char for char in url)
+    return f'url("{escaped}")'
+
+
+class ResponsiveImages:
+    # Serves the variants written by `flask build-images` and picks them from templates. Without a manifest
+    # (images not built yet) templates fall back to the original files.
+    def __init__(self):
+        self.manifest = {}
+        self.sources = set()
+        self.source_dir = None
+        self.output_dir = None
+
+    def init_app(self, app):
+        self.source_dir = os.path.join(app.static_folder, 'assets', 'img')
+        self.output_dir = app.config['IMAGE_BUILD_DIR']
+        self.load()
+        app.add_url_rule('/img/<path:filename>', 'hashed_image', self.send)
+        app.add_template_global(self.masthead_style, 'masthead_style')
+        app.extensions['images'] = self
+
+    def load(self):
+        try:
+            self.sources = set(os.listdir(self.source_dir))
+        except OSError:
+            self.sources = set()
+        try:
+            with open(os.path.join(self.output_dir, 'manifest.json')) as file:
+                self.manifest = json.load(file)
+        except (OSError, ValueError):
+            self.manifest = {}
+
+    def send(self, filename):
+        # Names carry a content hash, so a URL never changes meaning and can be cached for good.
+        response = send_from_directory(self.output_dir, filename, max_age=31536000)
+        response.cache_control.immutable = True
+        response.cache_control.public = True
+        return response
+
+    def image_set(self, variants):
+        sources = [f'{css_url(url_for("hashed_image", filename=variants[image_format]))} type("{mimetype}")'
+                   for image_format, mimetype, _ in FORMATS if image_format in variants]
+        return f"image-set({', '.join(sources)})"
+
+    def masthead_style(self, image, selector='.masthead'):
+        # A <style> block for the page header: the smallest variant at least as wide as the viewport, in the
+        # best format the browser supports. `image` is a file in static/assets/img or any other URL.
+        variants = self.manifest.get(image)
+        if not variants:
+            if image in self.sources:
+                url = url_for('static', filename=f'assets/img/{image}')
+            else:
+                # Post header URLs are stored HTML-escaped, and a <style> element does not decode entities.
+                url = html.unescape(image)
+            return Markup(f'<style>{selector}{{background-image:{css_url(url)}}}</style>')
+
+        widths = sorted(variants, key=int)
+        largest = variants[widths[-1]]
+        fallback = url_for('hashed_image', filename=largest.get('jpeg') or next(iter(largest.values())))
+        rules = [f'{selector}{{background-image:{css_url(fallback)};background-image:{self.image_set(largest)}}}']
+        # A variant covers viewports up to its width on standard screens and up to half of it on 2x screens.
+        for width in reversed(widths[:-1]):
+            query = f'(max-width:{width}px) and (max-resolution:1.5dppx),(max-width:{int(width) // 2}px)'
+            rules.append(f'@media {query}{{{selector}{{background-image:{self.image_set(variants[width])}}}}}')
+        return Markup(f"<style>{''.join(rules)}</style>")
+
+
+images = ResponsiveImages()
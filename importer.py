@@ -0,0 +1,336 @@
+import gzip
+import json
+import os
+import re
+import time
+from datetime import date, datetime
+from itertools import islice
+from sqlalchemy.exc import SQLAlchemyError
+from extensions import db, page_cache
+from models.models import UserBlog, BlogPost, Comment, Rating, utcnow
+from models.transactions import DatabaseError, touch_feed
+from search import search_index
+from utils import sanitize_input, avatar_hash
+
+EXTENSIONS = ('.json', '.ndjson', '.jsonl', '.md', '.markdown')
+DEFAULT_IMAGE = 'post-bg.jpg'
+FRONT_MATTER = re.compile(r'\A---\s*\n(.*?)\n---\s*(?:\n|\Z)', re.S)
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def source_files(path):
+    # Every importable file under `path` (or `path` itself), in a stable order so checkpoints stay valid.
+    if os.path.isfile(path):
+        return [path]
+    files = []
+    for directory, _, names in os.walk(path):
+        for name in names:
+            if not name.startswith('.') and name.removesuffix('.gz').endswith(EXTENSIONS):
+                files.append(os.path.join(directory, name))
+    return sorted(files)
+
+
+def front_matter(text):
+    # Flat `key: value` front matter, values optionally quoted. Returns (metadata, markdown body).
+    match = FRONT_MATTER.match(text)
+    if not match:
+        return {}, text
+    metadata = {}
+    for line in match.group(1).splitlines():
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        key, separator, value = line.partition(':')
+        if not separator:
+            raise ImportFormatError(f"Invalid front matter line: {line!r}")
+        value = value.strip()
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'':
+            value = value[1:-1]
+        metadata[key.strip().lower()] = value
+    return metadata, text[match.end():]
+
+
+def markdown_record(text):
+    from markdown_it import MarkdownIt
+
+    metadata, body = front_matter(text)
+    metadata.setdefault('img_url', metadata.pop('image', None))
+    return dict(metadata, type='post', body=MarkdownIt('commonmark').enable('table').render(body))
+
+
+def read_records(path):
+    # Yields the records of one file: a Markdown post, a JSON document (one record, a list, or
+    # {"posts": [...]}), or NDJSON with one record per line, streamed.
+    opener = gzip.open if path.endswith('.gz') else open
+    name = path.removesuffix('.gz')
+    with opener(path, 'rt', encoding='utf-8') as file:
+        if name.endswith(('.md', '.markdown')):
+            yield markdown_record(file.read())
+        elif name.endswith('.json'):
+            document = json.load(file)
+            if isinstance(document, dict) and 'posts' in document:
+                document = document['posts']
+            yield from document if isinstance(document, list) else [document]
+        else:
+            for number, line in enumerate(file, 1):
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError as error:
+                        raise ImportFormatError(f"{path}:{number}: {error}")
+
+
+def post_date(value):
+    # Posts store the display date; ISO dates from other platforms are converted.
+    if not value:
+        return date.today().strftime("%B %d, %Y")
+    if isinstance(value, (date, datetime)):
+        return value.strftime("%B %d, %Y")
+    try:
+        return datetime.fromisoformat(str(value)[:10]).strftime("%B %d, %Y")
+    except ValueError:
+        return str(value)
+
+
+def email_of(value):
+    return value.strip().lower() if isinstance(value, str) and value.strip() else None
+
+
+def flatten(record):
+    # A file record as (kind, fields) pairs: posts carry their comments and ratings inline, which become
+    # records of their own pointing at the post by title.
+    kind = record.get('type', 'post')
+    if kind == 'export':
+        # The header line of a flask export-content file.
+        return []
+    if kind not in ('user', 'post', 'comment', 'rating'):
+        raise ImportFormatError(f"Unknown record type: {kind!r}")
+    if kind in ('comment', 'rating') and not (record.get('post') and record.get('author')):
+        raise ImportFormatError(f"{kind.capitalize()} without a post title or author: {str(record)[:80]}")
+    if kind != 'post':
+        return [(kind, record)]
+    if not record.get('title') or not record.get('body'):
+        raise ImportFormatError(f"Post without a title or body: {str(record)[:80]}")
+    pairs = [('post', record)]
+    for comment in record.get('comments') or []:
+        pairs.append(('comment', dict(comment, post=record['title'])))
+    for rating in record.get('ratings') or []:
+        pairs.append(('rating', dict(rating, post=record['title'])))
+    return pairs
+
+
+class Importer:
+    # Streams records into the database in chunks, each chunk one transaction. Rows are matched on their
+    # natural keys (user email, post title, one comment and one rating per user and post), so records already
+    # in the database are skipped and an interrupted import can simply be run again. The checkpoint file
+    # records how far each source file got, so a rerun also skips the work of reading committed chunks.
+    def __init__(self, batch_size=500, default_author=None, checkpoint=None, progress=None):
+        self.batch_size = batch_size
+        self.default_author = email_of(default_author)
+        self.checkpoint = checkpoint
+        self.progress = progress
+        self.counts = {'users': 0, 'posts': 0, 'comments': 0, 'ratings': 0, 'skipped': 0}
+        self.done = {}
+        self.records = 0
+
+    def run(self, path):
+        start = time.perf_counter()
+        self.done = self._load_checkpoint()
+        for file in source_files(path):
+            key = os.path.abspath(file)
+            offset = self.done.get(key, 0)
+            if offset == 'complete':
+                continue
+            records = islice(read_records(file), offset, None)
+            while True:
+                chunk = list(islice(records, self.batch_size))
+                if not chunk:
+                    break
+                try:
+                    self._import_chunk(chunk)
+                except ImportFormatError as error:
+                    db.session.rollback()
+                    raise ImportFormatError(f"{file}, records {offset + 1}-{offset + len(chunk)}: {error}")
+                offset += len(chunk)
+                self.records += len(chunk)
+                self._save_checkpoint(key, offset)
+                self._report(start)
+            self._save_checkpoint(key, 'complete')
+        self._clear_checkpoint()
+        seconds = time.perf_counter() - start
+        rows = sum(self.counts[kind] for kind in ('users', 'posts', 'comments', 'ratings'))
+        return dict(self.counts, seconds=round(seconds, 2), rows_per_second=round(rows / seconds, 1) if seconds else 0)
+
+    def _import_chunk(self, chunk):
+        pairs = [pair for record in chunk for pair in flatten(record)]
+        try:
+            users = self._users(pairs)
+            posts, new_posts = self._posts(pairs, users)
+            touched = self._comments(pairs, users, posts)
+            rated = self._ratings(pairs, users, posts)
+            if rated:
+                self._update_rating_totals(rated)
+            touched = (touched | rated) - new_posts
+            if touched:
+                db.session.execute(db.update(BlogPost).where(BlogPost.id.in_(touched))
+                                   .values(version=BlogPost.version + 1, updated_at=utcnow()),
+                                   execution_options={'synchronize_session': False})
+            if new_posts:
+                touch_feed()
+            db.session.commit()
+        except SQLAlchemyError as error:
+            db.session.rollback()
+            raise DatabaseError(f"Error importing records: {str(error)}")
+        for post_id in touched:
+            page_cache.invalidate_post(post_id)
+        if new_posts:
+            page_cache.invalidate_index()
+
+    def _users(self, pairs):
+        # Maps every email the chunk mentions to a user id. User records are created as given (a password
+        # hash from an export keeps working), authors only known by email get an account without a password:
+        # they can't log in, or register the email again, until the admin sets one with `flask set-password`.
+        records = {}
+        for kind, record in pairs:
+            if kind == 'user':
+                email = email_of(record.get('email'))
+                if email is None:
+                    raise ImportFormatError("User record without an email")
+                records[email] = record
+            else:
+                email = email_of(record.get('author')) or (self.default_author if kind == 'post' else None)
+                if email is None:
+                    raise ImportFormatError(f"{kind.capitalize()} without an author: {str(record)[:80]}")
+                records.setdefault(email, {'email': email, 'name': record.get('author_name')})
+        users = dict(db.session.execute(db.select(UserBlog.email, UserBlog.id)
+                                        .where(UserBlog.email.in_(list(records)))).all())
+        rows = [{'email': email, 'name': sanitize_input(record.get('name') or email.split('@')[0]),
+                 'password': record.get('password'), 'add_post': bool(record.get('add_post', False)),
+                 'request': bool(record.get('request', False)), 'avatar_hash': avatar_hash(email)}
+                for email, record in records.items() if email not in users]
+        self.counts['skipped'] += sum(1 for kind, record in pairs
+                                      if kind == 'user' and email_of(record['email']) in users)
+        if rows:
+            users.update(db.session.execute(db.insert(UserBlog).returning(UserBlog.email, UserBlog.id), rows).all())
+            self.counts['users'] += len(rows)
+        return users
+
+    def _post_ids(self, titles):
+        if not titles:
+            return {}
+        return dict(db.session.execute(db.select(BlogPost.title, BlogPost.id)
+                                       .where(BlogPost.title.in_(list(titles)))).all())
+
+    def _posts(self, pairs, users):
+        # Titles are sanitized exactly as the new-post form does, then used to recognise existing posts.
+        records = {}
+        for kind, record in pairs:
+            if kind == 'post':
+                records.setdefault(sanitize_input(record['title']), record)
+        referenced = {sanitize_input(record['post']) for kind, record in pairs if kind in ('comment', 'rating')}
+        posts = self._post_ids(set(records) | referenced)
+        rows = []
+        for title, record in records.items():
+            if title in posts:
+                self.counts['skipped'] += 1
+                continue
+            author = email_of(record.get('author')) or self.default_author
+            rows.append({'title': title, 'subtitle': sanitize_input(record.get('subtitle') or ''),
+                         'body': record['body'], 'img_url': sanitize_input(record.get('img_url') or DEFAULT_IMAGE),
+                         'date': post_date(record.get('date')), 'author_id': users[author], 'updated_at': utcnow()})
+        new_posts = set()
+        if rows:
+            # Bulk inserts skip the session hooks, so the new posts are indexed here, in the same transaction.
+            created = db.session.execute(db.insert(BlogPost).returning(BlogPost.id, BlogPost.title,
+                                                                       BlogPost.subtitle, BlogPost.body), rows).all()
+            search_index.index(created)
+            posts.update((post.title, post.id) for post in created)
+            new_posts = {post.id for post in created}
+            self.counts['posts'] += len(created)
+        return posts, new_posts
+
+    def _children(self, kind, pairs, users, posts):
+        # (author id, post id) -> record for the comments or ratings of the chunk that are not stored yet.
+        wanted = {}
+        for record_kind, record in pairs:
+            if record_kind != kind:
+                continue
+            post_id = posts.get(sanitize_input(record['post']))
+            if post_id is None:
+                raise ImportFormatError(f"{kind.capitalize()} for unknown post {record['post']!r}")
+            key = (users[email_of(record['author'])], post_id)
+            if key in wanted:
+                self.counts['skipped'] += 1
+            wanted.setdefault(key, record)
+        if not wanted:
+            return {}
+        model = Comment if kind == 'comment' else Rating
+        existing = db.session.execute(db.select(model.author_id, model.post_id)
+                                      .where(model.post_id.in_({post_id for _, post_id in wanted}),
+                                             model.author_id.in_({author_id for author_id, _ in wanted}))).all()
+        for key in map(tuple, existing):
+            if wanted.pop(key, None) is not None:
+                self.counts['skipped'] += 1
+        return wanted
+
+    def _comments(self, pairs, users, posts):
+        wanted = self._children('comment', pairs, users, posts)
+        rows = []
+        for (author_id, post_id), record in wanted.items():
+            if not record.get('text'):
+                raise ImportFormatError(f"Comment without text on post {record['post']!r}")
+            rows.append({'author_id': author_id, 'post_id': post_id, 'text': record['text']})
+        if rows:
+            db.session.execute(db.insert(Comment), rows)
+            self.counts['comments'] += len(rows)
+        return {row['post_id'] for row in rows}
+
+    def _ratings(self, pairs, users, posts):
+        wanted = self._children('rating', pairs, users, posts)
+        rows = []
+        for (author_id, post_id), record in wanted.items():
+            try:
+                value = float(record.get('value'))
+            except (TypeError, ValueError):
+                value = -1
+            if not 0 <= value <= 10:
+                raise ImportFormatError(f"Rating must be between 0 and 10, got {record.get('value')!r}")
+            rows.append({'author_id': author_id, 'post_id': post_id, 'value': value})
+        if rows:
+            db.session.execute(db.insert(Rating), rows)
+            self.counts['ratings'] += len(rows)
+        return {row['post_id'] for row in rows}
+
+    @staticmethod
+    def _update_rating_totals(post_ids):
+        count_query = db.select(db.func.count(Rating.id)).where(Rating.post_id == BlogPost.id).scalar_subquery()
+        sum_query = (db.select(db.func.coalesce(db.func.sum(Rating.value), 0))
+                     .where(Rating.post_id == BlogPost.id).scalar_subquery())
+        db.session.execute(db.update(BlogPost).where(BlogPost.id.in_(post_ids))
+                           .values(rating_count=count_query, rating_sum=sum_query),
+                           execution_options={'synchronize_session': False})
+
+    def _report(self, start):
+        if self.progress is not None:
+            seconds = time.perf_counter() - start
+            rows = sum(self.counts[kind] for kind in ('users', 'posts', 'comments', 'ratings'))
+            self.progress(f"{self.records} record(s) read, {rows} row(s) imported, {rows / seconds:.0f} rows/s")
+
+    def _load_checkpoint(self):
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return {}
+        with open(self.checkpoint) as file:
+            return json.load(file)
+
+    def _save_checkpoint(self, key, offset):
+        self.done[key] = offset
+        if self.checkpoint:
+            with open(self.checkpoint + '.tmp', 'w') as file:
+                json.dump(self.done, file)
+            os.replace(self.checkpoint + '.tmp', self.checkpoint)
+
+    def _clear_checkpoint(self):
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
@@ -0,0 +1,156 @@
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprint(statement):
+    # The statement with its literals and IN-list lengths stripped, so the same query with other values matches.
+    statement = re.sub(r"'(?:[^']|'')*'", '?', statement)
+    statement = re.sub(r'%\(\w+\)s|:\w+|\$\d+|\b\d+(?:\.\d+)?\b', '?', statement)
+    statement = re.sub(r'\(\s*\?(?:\s*,\s*\?)*\s*\)', '(...)', statement)
+    return re.sub(r'\s+', ' ', statement).strip()
+
+
+class SQLInstrumentation:
+    # Optional per-request SQL accounting, enabled by SQL_INSTRUMENTATION. Each request gets its query count
+    # and DB time in a Server-Timing header and a JSON log line. A SELECT repeated SQL_N_PLUS_ONE_THRESHOLD
+    # times or more in one request is reported as a likely N+1, once per endpoint and statement.
+    def __init__(self):
+        self.enabled = False
+        self.threshold = 5
+        self.suspects = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('SQL_INSTRUMENTATION', False)
+        self.threshold = app.config.get('SQL_N_PLUS_ONE_THRESHOLD', 5)
+        app.extensions['sql_instrumentation'] = self
+        if not self.enabled:
+            return
+        with app.app_context():
+            for engine in db.engines.values():
+                if not event.contains(engine, 'before_cursor_execute', self._before_cursor_execute):
+                    event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+                    event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @staticmethod
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        if not has_request_context() or 'sql' not in g:
+            return
+        g.sql['queries'] += 1
+        g.sql['seconds'] += elapsed
+        g.sql['statements'][statement] += 1
+
+    @staticmethod
+    def _start_request():
+        g.sql = {'start': time.perf_counter(), 'queries': 0, 'seconds': 0.0, 'statements': Counter()}
+
+    def _finish_request(self, response):
+        stats = g.pop('sql', None)
+        if stats is None:
+            return response
+        total_ms = (time.perf_counter() - stats['start']) * 1000
+        db_ms = stats['seconds'] * 1000
+        endpoint = request.endpoint or 'unknown'
+
+        fingerprints = Counter()
+        for statement, count in stats['statements'].items():
+            fingerprints[fingerprint(statement)] += count
+        repeated = [{'fingerprint': text, 'count': count} for text, count in fingerprints.most_common()
+                    if count > 1]
+        suspected = [entry for entry in repeated
+                     if entry['count'] >= self.threshold and entry['fingerprint'].upper().startswith('SELECT')]
+        for entry in suspected:
+            self._flag(endpoint, entry['fingerprint'], entry['count'])
+
+        response.headers.add('Server-Timing', f'db;dur={db_ms:.1f};desc="{stats["queries"]} queries"')
+        response.headers.add('Server-Timing', f'app;dur={total_ms:.1f}')
+        logger.info(json.dumps({
+            'event': 'request',
+            'method': request.method,
+            'path': request.path,
+            'endpoint': endpoint,
+            'status': response.status_code,
+            'duration_ms': round(total_ms, 2),
+            'db_queries': stats['queries'],
+            'db_ms': round(db_ms, 2),
+            'repeated': repeated[:5],
+            'n_plus_one': bool(suspected),
+        }))
+        return response
+
+    def _flag(self, endpoint, text, count):
+        with self._lock:
+            statements = self.suspects.setdefault(endpoint, {})
+            first = text not in statements
+            statements[text] = max(count, statements.get(text, 0))
+        if first:
+            logger.warning("Possible N+1 on %s: %d executions of %s", endpoint, count, text)
+
+    def stats(self):
+        with self._lock:
+            return {'enabled': self.enabled, 'threshold': self.threshold,
+                    'n_plus_one': {endpoint: dict(statements) for endpoint, statements in self.suspects.items()}}
+
+
+sql_instrumentation = SQLInstrumentation()
+
+
+@contextmanager
+def count_queries(app):
+    """Collects the statements every engine of `app` executes inside the block.
+
+        with count_queries(app) as statements:
+            client.get('/')
+        assert len(statements) <= 2
+    """
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', record)
+
+
+def assert_query_budget(client, budgets, **request_options):
+    """Fails when a route runs more queries than its budget, for use in pytest.
+
+        def test_query_budgets(client):
+            assert_query_budget(client, {'/': 2, '/post/1': 3, '/user': 6})
+
+    `budgets` maps paths to the maximum number of queries one GET may run; `request_options` are passed to
+    client.get(). The failure lists every route over budget with its repeated statements.
+    """
+    failures = []
+    for path, budget in budgets.items():
+        with count_queries(client.application) as statements:
+            client.get(path, **request_options)
+        if len(statements) > budget:
+            repeated = Counter(fingerprint(statement) for statement in statements).most_common(3)
+            details = '\n'.join(f"    {count} x {text}" for text, count in repeated)
+            failures.append(f"{path}: {len(statements)} queries, budget {budget}\n{details}")
+    assert not failures, "Query budget exceeded:\n" + '\n'.join(failures)
@@ -1,8 +1,8 @@
 from flask import Blueprint, render_template, redirect, url_for, flash
 from flask_login import current_user, login_required
 from models.models import Comment
-from models.transactions import DatabaseError, get_by_id, put, delete
-from extensions import limiter
+from models.transactions import DatabaseError, get_for_update, touch_post, put, delete
+from extensions import limiter, page_cache
 from .forms import CommentForm
 
 comment_bp = Blueprint('comment', __name__)
@@ -13,7 +13,7 @@ comment_bp = Blueprint('comment', __name__)
 @login_required
 def edit_comment(comment_id):
     try:
-        comment = get_by_id(model=Comment, id_reference=comment_id)
+        comment = get_for_update(model=Comment, id_reference=comment_id)
 
         if not comment:
             flash('Comment record not found', 'error')
@@ -27,7 +27,9 @@ def edit_comment(comment_id):
 
         if form.validate_on_submit():
             comment.text = form.comment.data
+            touch_post(comment.parent_post)
             put()
+            page_cache.invalidate_post(comment.post_id)
             flash('Your comment has been modified', 'success')
             return redirect(url_for('main.user'))
 
@@ -42,7 +44,7 @@ def edit_comment(comment_id):
 @login_required
 def delete_comment(comment_id):
     try:
-        comment = get_by_id(model=Comment, id_reference=comment_id)
+        comment = get_for_update(model=Comment, id_reference=comment_id)
 
         if not comment:
             flash('Comment record not found', 'error')
@@ -52,7 +54,9 @@ def delete_comment(comment_id):
             flash('You are not allowed to delete this comment!', 'error')
             return redirect(url_for('main.user'))
 
+        touch_post(comment.parent_post)
         delete(comment)
+        page_cache.invalidate_post(comment.post_id)
         flash('Your comment has been deleted', 'success')
 
     except DatabaseError as e:
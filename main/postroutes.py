@@ -1,30 +1,95 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, current_app, render_template, redirect, url_for, flash, request, abort, Response
 from flask_login import current_user, login_required
 from models.models import BlogPost, Comment, Rating
-from models.transactions import get_all, get_by_id, get_by_author_id, add, put, delete, DatabaseError, IntegrityError
-from extensions import limiter
+from models.transactions import get_feed, get_for_update, get_post_with_comments, get_by_author_id, get_post_state, \
+    get_feed_state, adjust_rating_totals, touch_post, touch_feed, add, put, delete, DatabaseError, IntegrityError
+from extensions import limiter, page_cache
+from cache import conditional
+from search import search_index
+from feeds import site_document, MIMETYPES
 from .forms import CreatePostForm, CommentForm, RatingForm
 from utils import sanitize_input
 from datetime import date
-from statistics import mean
 
 post_bp = Blueprint('post', __name__)
 
 
+def feed_validator():
+    try:
+        state = get_feed_state()
+    except DatabaseError:
+        return None
+    if state is None:
+        return 'feed-0', None
+    return f'feed-{state.version}', state.updated_at
+
+
+def post_validator(post_id):
+    try:
+        state = get_post_state(post_id)
+    except DatabaseError:
+        return None
+    if state is None:
+        return None
+    return f'post-{post_id}-{state.version}', state.updated_at
+
+
 @post_bp.route('/')
+@conditional(feed_validator)
+@page_cache.cached('index', query_args={'after': int})
 def get_all_posts():
     try:
-        posts = get_all(BlogPost)
-        return render_template('index.html', all_posts=posts, current_user=current_user)
+        after = request.args.get('after', type=int)
+        posts, next_cursor = get_feed(after=after, limit=current_app.config['POSTS_PER_PAGE'])
+        return render_template('index.html', all_posts=posts, next_cursor=next_cursor, current_user=current_user)
+    except DatabaseError as e:
+        flash(e.message, 'error')
+        return redirect(url_for('main.error'))
+
+
+def site_xml(name):
+    try:
+        return Response(site_document(name), mimetype=MIMETYPES[name])
+    except DatabaseError:
+        abort(503)
+
+
+@post_bp.route('/feed.xml')
+@conditional(feed_validator)
+def feed():
+    return site_xml('feed.xml')
+
+
+@post_bp.route('/sitemap.xml')
+@conditional(feed_validator)
+def sitemap():
+    return site_xml('sitemap.xml')
+
+
+@post_bp.route('/search')
+@limiter.limit("30 per minute")
+def search():
+    query = request.args.get('q', '').strip()[:200]
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = current_app.config['POSTS_PER_PAGE']
+    results = []
+    try:
+        if query:
+            # One extra row tells whether there is a next page.
+            results = search_index.search(query, limit=per_page + 1, offset=(page - 1) * per_page)
     except DatabaseError as e:
         flash(e.message, 'error')
         return redirect(url_for('main.error'))
+    return render_template('search.html', query=query, results=results[:per_page], page=page,
+                           has_next=len(results) > per_page, current_user=current_user)
 
 
 @post_bp.route('/post/<int:post_id>', methods=['GET', 'POST'])
+@conditional(post_validator)
+@page_cache.cached(lambda post_id: f'post-{post_id}')
 def show_post(post_id):
     try:
-        post = get_by_id(model=BlogPost, id_reference=post_id)
+        post = get_post_with_comments(post_id)
 
         if not post:
             flash('Post record not found', 'error')
@@ -51,7 +116,9 @@ def show_post(post_id):
                     author_id=current_user.id,
                     post_id=post.id
                 )
+                touch_post(post)
                 add(new_comment)
+                page_cache.invalidate_post(post_id)
                 flash('Comment submitted successfully.', 'success')
 
                 return redirect(url_for('post.show_post', post_id=post_id))
@@ -68,14 +135,16 @@ def show_post(post_id):
                     author_id=current_user.id,
                     post_id=post.id
                 )
+                adjust_rating_totals(post, 1, new_rating.value)
+                touch_post(post)
                 add(new_rating)
+                page_cache.invalidate_post(post_id)
                 flash('Rating submitted successfully.', 'success')
 
                 return redirect(url_for('post.show_post', post_id=post_id))
 
-        mean_ratings = mean([rating.value for rating in post.ratings]) if post.ratings else 0
         return render_template('post.html', post=post, current_user=current_user, form=comment_form, form2=rating_form,
-                               mean=mean_ratings)
+                               mean=post.rating_mean)
     except IntegrityError:
         flash('A database constraint was violated', 'error')
     except DatabaseError as e:
@@ -97,12 +166,14 @@ def add_new_post():
                 subtitle=sanitize_input(form.subtitle.data),
                 body=form.body.data,
                 img_url=sanitize_input(form.img_url.data),
-                author=current_user,
+                author_id=current_user.id,
                 date=date.today().strftime("%B %d, %Y")
             )
 
             try:
+                touch_feed()
                 add(new_post)
+                page_cache.invalidate_index()
                 return redirect(url_for('post.get_all_posts'))
 
             except IntegrityError as e:
@@ -126,7 +197,7 @@ def add_new_post():
 @limiter.limit("5 per hour")
 def edit_post(post_id):
     try:
-        post = get_by_id(model=BlogPost, id_reference=post_id)
+        post = get_for_update(model=BlogPost, id_reference=post_id)
 
         if not post:
             flash('Post record not found', 'error')
@@ -148,7 +219,11 @@ def edit_post(post_id):
             post.subtitle = sanitize_input(form.subtitle.data)
             post.body = form.body.data
             post.img_url = sanitize_input(form.img_url.data)
+            touch_post(post, edited=True)
+            touch_feed()
             put()
+            page_cache.invalidate_post(post.id)
+            page_cache.invalidate_index()
             return redirect(url_for("post.show_post", post_id=post.id))
 
         return render_template("make-post.html", form=form, is_edit=True)
@@ -169,7 +244,7 @@ def edit_post(post_id):
 @limiter.limit("3 per hour")
 def delete_post(post_id):
     try:
-        post = get_by_id(model=BlogPost, id_reference=post_id)
+        post = get_for_update(model=BlogPost, id_reference=post_id)
 
         if not post:
             flash('Post record not found', 'error')
@@ -179,7 +254,10 @@ def delete_post(post_id):
             flash('You are not allowed to delete this post!', 'error')
             return redirect(url_for('main.user'))
 
+        touch_feed()
         delete(post)
+        page_cache.invalidate_post(post_id)
+        page_cache.invalidate_index()
         flash('The selected post has been deleted', 'success')
 
     except DatabaseError as e:
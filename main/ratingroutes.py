@@ -1,8 +1,8 @@
 from flask import Blueprint, render_template, redirect, url_for, flash
 from flask_login import current_user, login_required
 from models.models import Rating
-from models.transactions import DatabaseError, get_by_id, put, delete
-from extensions import limiter
+from models.transactions import DatabaseError, get_for_update, touch_post, adjust_rating_totals, put, delete
+from extensions import limiter, page_cache
 from .forms import RatingForm
 
 rating_bp = Blueprint('rating', __name__)
@@ -13,7 +13,7 @@ rating_bp = Blueprint('rating', __name__)
 @login_required
 def edit_rating(rating_id):
     try:
-        rating = get_by_id(model=Rating, id_reference=rating_id)
+        rating = get_for_update(model=Rating, id_reference=rating_id)
 
         if not rating:
             flash('Rating record not found', 'error')
@@ -26,8 +26,12 @@ def edit_rating(rating_id):
             return redirect(url_for('main.user'))
 
         if form.validate_on_submit():
-            rating.value = float(form.rating.data)
+            new_value = float(form.rating.data)
+            adjust_rating_totals(rating.parent_post, 0, new_value - rating.value)
+            rating.value = new_value
+            touch_post(rating.parent_post)
             put()
+            page_cache.invalidate_post(rating.post_id)
             flash('Your new rating has been submitted', 'success')
             return redirect(url_for('main.user'))
 
@@ -42,7 +46,7 @@ def edit_rating(rating_id):
 @login_required
 def delete_rating(rating_id):
     try:
-        rating = get_by_id(model=Rating, id_reference=rating_id)
+        rating = get_for_update(model=Rating, id_reference=rating_id)
 
         if not rating:
             flash('Rating record not found', 'error')
@@ -52,7 +56,10 @@ def delete_rating(rating_id):
             flash('You are not allowed to delete this rating!', 'error')
             return redirect(url_for('main.user'))
 
+        adjust_rating_totals(rating.parent_post, -1, -rating.value)
+        touch_post(rating.parent_post)
         delete(rating)
+        page_cache.invalidate_post(rating.post_id)
         flash('Your rating has been deleted', 'success')
 
     except DatabaseError as e:
@@ -1,13 +1,19 @@
-from flask import Blueprint, current_app, render_template, redirect, url_for, flash, request
+from datetime import date
+from flask import Blueprint, current_app, render_template, redirect, url_for, flash, request, jsonify, abort, \
+    send_file, Response, stream_with_context
 from flask_login import current_user, login_required
 from models.models import UserBlog
-from models.transactions import DatabaseError, get_by_id, get_by_condition, put
-from extensions import limiter
+from models.transactions import DatabaseError, get_for_update, get_all_for_update, get_permission_page, \
+    get_user_dashboard, touch_feed, add, put
+from extensions import limiter, page_cache, recaptcha
 from .forms import RequestForm
-from utils import verify_recaptcha, send_email_async, sanitize_input, validate_email, send_text, text_unsent
+from utils import verify_recaptcha, sanitize_input, validate_email
+from outbox import queue_email, queue_sms_digest
 from admin import admin_required
-from email.mime.text import MIMEText
-import asyncio
+from usercache import user_cache
+from instrumentation import sql_instrumentation
+from profiler import profiler, SORT_KEYS
+from exporter import export_records, ndjson
 
 main_bp = Blueprint('main', __name__)
 
@@ -18,8 +24,18 @@ def error():
 
 
 @main_bp.route('/user')
+@login_required
 def user():
-    return render_template('user.html', user=current_user)
+    try:
+        dashboard = get_user_dashboard(current_user.id,
+                                       posts_page=request.args.get('posts_page', 1, type=int),
+                                       comments_page=request.args.get('comments_page', 1, type=int),
+                                       ratings_page=request.args.get('ratings_page', 1, type=int),
+                                       per_page=current_app.config['DASHBOARD_PER_PAGE'])
+    except DatabaseError as e:
+        flash(e.message, 'error')
+        return redirect(url_for('main.error'))
+    return render_template('user.html', user=current_user, **dashboard)
 
 
 @main_bp.route("/about")
@@ -27,69 +43,146 @@ def about():
     return render_template("about.html")
 
 
+def decide_posting(user, allow):
+    # Answers the user's request (or revokes the permission) and queues the email telling them.
+    user.add_post = allow
+    user.request = False
+    if allow:
+        queue_email("Your request to post has been accepted.",
+                    f"Hello {user.name},\nYour request to add posts has been accepted.\nYou can start "
+                    f"adding posts. \nSincerely,\nThe Blog.",
+                    recipient=user.email)
+    else:
+        queue_email("Your request to post has been denied.",
+                    f"Hello {user.name},\nPlease note that your request to add posts has been denied "
+                    f"at this time. \nSincerely,\nThe Blog.",
+                    recipient=user.email)
+
+
 @main_bp.route('/process-posting/<int:user_id>/<int:user_allow>')
 @admin_required
 def process_posting(user_id, user_allow):
     try:
-        user_to_allow = get_by_id(model=UserBlog, id_reference=user_id)
+        user_to_allow = get_for_update(model=UserBlog, id_reference=user_id)
 
         if not user_to_allow:
             flash('User record can not be retrieved', 'error')
             return redirect(url_for('main.permission'))
 
+        decide_posting(user_to_allow, user_allow == 1)
         if user_allow == 1:
-            user_to_allow.add_post = True
-
-            msg = MIMEText(
-                f"Hello {user_to_allow.name},\nYour request to add posts has been accepted.\nYou can start adding "
-                f"posts. \nSincerely,\nThe Blog.", 'plain', 'utf-8')
-            msg['Subject'] = "Your request to post has been accepted."
-
-            email_sent = asyncio.run(send_email_async(
-                message=msg, recepient_email=user_to_allow.email))
-
-            if not email_sent:
-                flash('Error sending update to recepient', 'error')
-            elif email_sent:
-                flash('User posting permission granted.', "success")
+            flash('User posting permission granted.', "success")
         else:
-            user_to_allow.add_post = False
-
-            msg = MIMEText(
-                f"Hello {user_to_allow.name},\nPlease "
-                f"note that your request to add posts has been denied at this time. \nSincerely,\nThe Blog.", 'plain',
-                'utf-8')
-            msg['Subject'] = "Your request to post has been denied."
+            flash('User has no pending requests.', 'warning')
 
-            email_sent = asyncio.run(send_email_async(message=msg, recepient_email=user_to_allow.email))
-
-            if not email_sent:
-                flash('Error sending update to recepient', 'error')
-            elif email_sent:
-                flash('User has no pending requests.', 'warning')
-
-        user_to_allow.request = False
+        # The home page shows admins a revoke link next to authors allowed to post.
+        touch_feed()
         put()
+        user_cache.invalidate(user_id)
     except DatabaseError as e:
         flash(e.message, 'error')
     finally:
         return redirect(url_for('main.permission'))
 
 
+@main_bp.route('/process-posting', methods=['POST'])
+@admin_required
+def process_postings():
+    # Bulk approve, deny or revoke: every selected user is updated in one transaction, and the emails are
+    # queued in it too, so the outbox sender delivers them together over one SMTP session.
+    action = request.form.get('action')
+    user_ids = request.form.getlist('user_ids', type=int)
+    page = request.form.get('page', 1, type=int)
+    if action not in ('approve', 'deny', 'revoke') or not user_ids:
+        flash('Select at least one user.', 'error')
+        return redirect(url_for('main.permission', page=page))
+    try:
+        users = get_all_for_update(UserBlog, user_ids)
+        for user_to_process in users:
+            decide_posting(user_to_process, action == 'approve')
+        touch_feed()
+        put()
+        user_cache.invalidate(*(user_to_process.id for user_to_process in users))
+        verb = {'approve': 'approved', 'deny': 'denied', 'revoke': 'revoked'}[action]
+        flash(f'{len(users)} user(s) {verb}.', 'success' if action == 'approve' else 'warning')
+    except DatabaseError as e:
+        flash(e.message, 'error')
+    return redirect(url_for('main.permission', page=page))
+
+
 @main_bp.route('/permission')
 @admin_required
 def permission():
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = current_app.config['PERMISSION_PER_PAGE']
     try:
-        authors = get_by_condition(UserBlog, 'add_post', True)
-        users = get_by_condition(UserBlog, 'request', True)
-        return render_template('permission.html', users=users, authors=authors)
-    except ValueError as e:
-        flash(str(e), 'error')
+        users, authors, total = get_permission_page(page, per_page)
+        return render_template('permission.html', users=users, authors=authors, page=page,
+                               pages=max(1, -(-total // per_page)))
     except DatabaseError as e:
         flash(e.message, 'error')
     return redirect(url_for('main.error'))
 
 
+@main_bp.route('/cache-stats')
+@admin_required
+def cache_stats():
+    return jsonify(page_cache.stats())
+
+
+@main_bp.route('/recaptcha-stats')
+@admin_required
+def recaptcha_stats():
+    return jsonify(recaptcha.stats())
+
+
+@main_bp.route('/sql-stats')
+@admin_required
+def sql_stats():
+    return jsonify(sql_instrumentation.stats())
+
+
+@main_bp.route('/profiles')
+@admin_required
+def profiles():
+    return render_template('profiles.html', profiles=profiler.list(), enabled=profiler.enabled,
+                           sample_rate=profiler.sample_rate)
+
+
+@main_bp.route('/profiles/<profile_id>')
+@admin_required
+def show_profile(profile_id):
+    sort = request.args.get('sort', 'cumulative')
+    report = profiler.report(profile_id, sort=sort)
+    if report is None:
+        abort(404)
+    metadata, table = report
+    return render_template('profiles.html', profile=metadata, table=table, sort=sort, sort_keys=SORT_KEYS)
+
+
+@main_bp.route('/profiles/<profile_id>.pstats')
+@admin_required
+def download_profile(profile_id):
+    path = profiler.path(profile_id)
+    if path is None:
+        abort(404)
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                     download_name=f'{profile_id}.pstats')
+
+
+@main_bp.route('/export')
+@admin_required
+def export():
+    # Streamed as it is read, so the response starts at once and memory stays flat whatever the database size.
+    compress = request.args.get('gzip') == '1'
+    filename = f"the-blog-{date.today().isoformat()}.ndjson" + ('.gz' if compress else '')
+    response = Response(stream_with_context(ndjson(export_records(), compress=compress)),
+                        mimetype='application/gzip' if compress else 'application/x-ndjson')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
 @main_bp.route('/request-posting', methods=["GET", "POST"])
 @login_required
 @limiter.limit("15 per hour")
@@ -98,7 +191,7 @@ def request_posting():
 
     if form.submit.data and form.validate():
         recaptcha_response = request.form.get('g-recaptcha-response')
-        recaptcha_success = asyncio.run(verify_recaptcha(recaptcha_response))
+        recaptcha_success = verify_recaptcha(recaptcha_response)
 
         if not recaptcha_success:
             flash('Recaptcha verification failed.', 'error')
@@ -107,34 +200,18 @@ def request_posting():
         reason = sanitize_input(form.reason.data)
 
         try:
-            msg = MIMEText(f"Name: {current_user.name}\nEmail: {current_user.email}\nRequest:{reason}", 'plain',
-                           'utf-8')
-            msg['Subject'] = f"New Request to post on The Blog from {current_user.name}"
-        except DatabaseError as e:
-            flash(f'Your request has not been submitted{e.message}', 'error')
-            return redirect(url_for('main.request_posting'))
-
-        try:
-            current_user.request = True
+            requester = get_for_update(model=UserBlog, id_reference=current_user.id)
+            requester.request = True
+            queue_email(f"New Request to post on The Blog from {current_user.name}",
+                        f"Name: {current_user.name}\nEmail: {current_user.email}\nRequest:{reason}")
+            queue_sms_digest('posting-requests', "Requests to post pending",
+                             f"{current_user.name} <{current_user.email}>", current_app.config['SMS_DIGEST_WINDOW'])
             put()
+            user_cache.invalidate(current_user.id)
         except DatabaseError as e:
             flash(f'Your request has not been submitted{e.message}', 'error')
             return redirect(url_for('main.request_posting'))
 
-        asyncio.run(send_email_async(message=msg, recepient_email=None))
-
-        try:
-            result = asyncio.run(send_text('You have a request to post pending.'))
-            if not result['success']:
-                text_unsent(
-                    MIMEText(f"An error occurred while sending a text notification:\n{result['error']}.\n Check logs.",
-                             'plain',
-                             'utf-8'))
-        except Exception as e:
-            text_unsent(
-                MIMEText(f"An error occurred while sending a text notification:\n{str(e)}.\n Check logs", 'plain',
-                         'utf-8'))
-
         flash(f'Your request has been submitted', 'success')
 
         return redirect(url_for('main.request_posting'))
@@ -151,7 +228,7 @@ def contact():
             return redirect(url_for("auth.login"))
 
         recaptcha_response = request.form['g-recaptcha-response']
-        if not asyncio.run(verify_recaptcha(recaptcha_response)):
+        if not verify_recaptcha(recaptcha_response):
             flash("reCAPTCHA verification failed. Please try again.", "error")
             return redirect(url_for("main.contact"))
 
@@ -168,12 +245,10 @@ def contact():
             flash("Please enter a valid email address", 'error')
             return redirect(url_for("main.contact"))
 
-        subject = f"New Question from The Blog from {name}"
-        body = f"Name: {name}\nEmail: {email}\nPhone: {phone}\nMessage:\n{message}"
-        msg = MIMEText(body, 'plain', 'utf-8')
-        msg['Subject'] = subject
-
-        if not asyncio.run(send_email_async(msg, None)):
+        try:
+            add(queue_email(f"New Question from The Blog from {name}",
+                            f"Name: {name}\nEmail: {email}\nPhone: {phone}\nMessage:\n{message}"))
+        except DatabaseError:
             flash('There was an error sending your message.', 'error')
             return redirect(url_for("main.contact"))
 
@@ -1,16 +1,24 @@
+from datetime import datetime, timezone
 from flask_login import UserMixin
 from sqlalchemy.orm import relationship
 from extensions import db
 
 
+def utcnow():
+    # Naive UTC, the form DateTime columns hold on both SQLite and Postgres.
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 class UserBlog(UserMixin, db.Model):
     __tablename__ = "users_blog"
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(100), unique=True)
     password = db.Column(db.String(100))
     name = db.Column(db.String(1000))
-    add_post = db.Column(db.Boolean, default=False)
-    request = db.Column(db.Boolean, default=False)
+    add_post = db.Column(db.Boolean, default=False, index=True)
+    request = db.Column(db.Boolean, default=False, index=True)
+    # md5 of the normalised email, precomputed for gravatar links.
+    avatar_hash = db.Column(db.String(32))
     # This will act like a List of BlogPost objects attached to each User.
     # The "author" refers to the author property in the BlogPost class.
     posts = relationship("BlogPost", back_populates="author")
@@ -23,7 +31,7 @@ class BlogPost(db.Model):
     id = db.Column(db.Integer, primary_key=True)
 
     # Create Foreign Key, "users.id" the users refers to the tablename of User.
-    author_id = db.Column(db.Integer, db.ForeignKey("users_blog.id"))
+    author_id = db.Column(db.Integer, db.ForeignKey("users_blog.id"), index=True)
     # Create reference to the User object, the "posts" refers to the posts property in the User class.
     author = relationship("UserBlog", back_populates="posts")
 
@@ -32,15 +40,29 @@ class BlogPost(db.Model):
     date = db.Column(db.String(250), nullable=False)
     body = db.Column(db.Text, nullable=False)
     img_url = db.Column(db.String(250), nullable=False)
+    # Running rating totals, kept in step with the ratings table by the rating write paths.
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_sum = db.Column(db.Float, nullable=False, default=0, server_default='0')
+    # Bumped whenever the rendered post page changes, used to build HTTP validators.
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    updated_at = db.Column(db.DateTime, default=utcnow)
+    # Only moved by creating or editing the post itself, not by its comments and ratings. Used by the feed and sitemap.
+    edited_at = db.Column(db.DateTime, default=utcnow)
 
     comments = relationship("Comment", back_populates="parent_post", cascade="all, delete-orphan")
     ratings = relationship("Rating", back_populates="parent_post", cascade="all, delete-orphan")
 
+    @property
+    def rating_mean(self):
+        return self.rating_sum / self.rating_count if self.rating_count else 0
+
 
 class Comment(db.Model):
     __tablename__ = "comments"
+    # One comment per user and post, the index also serves lookups by author.
+    __table_args__ = (db.Index("uq_comments_author_post", "author_id", "post_id", unique=True),)
     id = db.Column(db.Integer, primary_key=True)
-    post_id = db.Column(db.Integer, db.ForeignKey("blog_posts.id"))
+    post_id = db.Column(db.Integer, db.ForeignKey("blog_posts.id"), index=True)
     author_id = db.Column(db.Integer, db.ForeignKey("users_blog.id"))
     parent_post = relationship("BlogPost", back_populates="comments")
     comment_author = relationship("UserBlog", back_populates="comments")
@@ -49,9 +71,50 @@ class Comment(db.Model):
 
 class Rating(db.Model):
     __tablename__ = "ratings"
+    # One rating per user and post, the index also serves lookups by author.
+    __table_args__ = (db.Index("uq_ratings_author_post", "author_id", "post_id", unique=True),)
     id = db.Column(db.Integer, primary_key=True)
-    post_id = db.Column(db.Integer, db.ForeignKey("blog_posts.id"))
+    post_id = db.Column(db.Integer, db.ForeignKey("blog_posts.id"), index=True)
     author_id = db.Column(db.Integer, db.ForeignKey("users_blog.id"))
     parent_post = relationship("BlogPost", back_populates="ratings")
     rating_author = relationship("UserBlog", back_populates="ratings")
     value = db.Column(db.Float, nullable=False)
+
+
+class FeedState(db.Model):
+    # Single row tracking changes to the set of posts listed on the home page.
+    __tablename__ = "feed_state"
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime)
+
+
+class SiteDocument(db.Model):
+    # Generated documents such as the Atom feed and the sitemap, stored with the feed version they were built
+    # from so every worker serves the same copy until the posts change again.
+    __tablename__ = "site_documents"
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    updated_at = db.Column(db.DateTime, default=utcnow)
+
+
+class OutboxMessage(db.Model):
+    # Outgoing email and SMS, written in the same transaction as the change that triggers them and
+    # delivered by the background sender in outbox.py.
+    __tablename__ = "outbox_messages"
+    __table_args__ = (db.Index("ix_outbox_messages_due", "status", "next_attempt_at"),)
+    id = db.Column(db.Integer, primary_key=True)
+    channel = db.Column(db.String(10), nullable=False)
+    # Empty for messages addressed to the site owner.
+    recipient = db.Column(db.String(100))
+    subject = db.Column(db.String(250))
+    body = db.Column(db.Text, nullable=False)
+    # Messages sharing a key are merged into one digest while still waiting for their send window.
+    coalesce_key = db.Column(db.String(50))
+    status = db.Column(db.String(10), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+    claimed_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=utcnow)
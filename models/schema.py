@@ -0,0 +1,36 @@
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateColumn
+from extensions import db
+from models.transactions import DatabaseError
+
+
+def upgrade_schema():
+    # db.create_all() only creates missing tables, this adds the columns and indexes introduced on existing ones.
+    engine = db.engine
+    inspector = inspect(engine)
+    applied = []
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+                applied.append(f"{table.name}.{column.name}")
+
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in sorted(table.indexes, key=lambda item: item.name):
+                if index.name in existing:
+                    continue
+                try:
+                    index.create(connection)
+                except IntegrityError:
+                    raise DatabaseError(f"Can not create {index.name}: {table.name} holds duplicate rows for "
+                                        f"({', '.join(column.name for column in index.columns)}), remove them "
+                                        f"and run the upgrade again.")
+                applied.append(index.name)
+    return applied
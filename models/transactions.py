@@ -1,6 +1,16 @@
-from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+import random
+import time
+from collections import namedtuple
+from functools import wraps
+from flask import current_app
+from sqlalchemy import inspect
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError, OperationalError
+from sqlalchemy.orm import ColumnProperty, joinedload, selectinload
 from extensions import db
-from models.models import UserBlog
+from models.models import UserBlog, BlogPost, Comment, Rating, FeedState, SiteDocument, utcnow
+
+# One page of a /user dashboard section: the rows, the page shown, the number of pages and the row count.
+DashboardSection = namedtuple('DashboardSection', 'items page pages total')
 
 
 class DatabaseError(Exception):
@@ -9,17 +19,55 @@ class DatabaseError(Exception):
         super().__init__(self.message)
 
 
+def replica_read(f):
+    # Lets the helper's queries go to a replica bind when one is configured, see routing.RoutingSession.
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        info = db.session.info
+        previous = info.get('replica_read', False)
+        info['replica_read'] = True
+        try:
+            return f(*args, **kwargs)
+        finally:
+            info['replica_read'] = previous
+
+    return decorated_function
+
+
+@replica_read
 def get_all(model, page=None, per_page=None):
     try:
-        query = db.session.query(model)
         if page and per_page:
-            query = query.paginate(page, per_page)
-        return query.all()
+            return db.paginate(db.select(model).order_by(model.id), page=page, per_page=per_page,
+                               error_out=False).items
+        return db.session.query(model).all()
 
     except SQLAlchemyError as error:
         raise DatabaseError(f"Error retrieving all records from {model.__tablename__}: {str(error)}")
 
 
+@replica_read
+def get_feed(after=None, limit=10):
+    # Newest-first keyset page over the columns index.html needs, author joined in the same query.
+    # Returns (rows, next_cursor); next_cursor is None on the last page.
+    try:
+        query = (db.select(BlogPost.id, BlogPost.title, BlogPost.subtitle, BlogPost.date, BlogPost.author_id,
+                           UserBlog.name.label('author_name'), UserBlog.add_post.label('author_add_post'))
+                 .outerjoin(UserBlog, BlogPost.author_id == UserBlog.id)
+                 .order_by(BlogPost.id.desc())
+                 .limit(limit + 1))
+        if after is not None:
+            query = query.where(BlogPost.id < after)
+        rows = db.session.execute(query).all()
+        if len(rows) > limit:
+            return rows[:limit], rows[limit - 1].id
+        return rows, None
+
+    except SQLAlchemyError as error:
+        raise DatabaseError(f"Error retrieving posts from {BlogPost.__tablename__}: {str(error)}")
+
+
+@replica_read
 def get_by_id(model, id_reference):
     try:
         return db.session.get(model, id_reference)
@@ -27,6 +75,107 @@ def get_by_id(model, id_reference):
         raise DatabaseError(f"Error retrieving record from {model.__tablename__}: {str(error)}")
 
 
+def get_for_update(model, id_reference):
+    # For routes that change the row they load: always read from the primary, refreshing a copy a replica read
+    # left in the session, and lock the row where the database supports it until the write commits.
+    try:
+        return db.session.get(model, id_reference, populate_existing=True, with_for_update=True)
+    except SQLAlchemyError as error:
+        raise DatabaseError(f"Error retrieving record from {model.__tablename__}: {str(error)}")
+
+
+@replica_read
+def get_post_with_comments(post_id):
+    # Two queries whatever the thread size: the post with its author, then the comments with theirs.
+    try:
+        query = (db.select(BlogPost)
+                 .where(BlogPost.id == post_id)
+                 .options(joinedload(BlogPost.author),
+                          selectinload(BlogPost.comments).joinedload(Comment.comment_author)))
+        return db.session.execute(query).unique().scalar_one_or_none()
+    except SQLAlchemyError as error:
+        raise DatabaseError(f"Error retrieving record from {BlogPost.__tablename__}: {str(error)}")
+
+
+@replica_read
+def get_post_state(post_id):
+    try:
+        return db.session.execute(db.select(BlogPost.version, BlogPost.updated_at)
+                                  .where(BlogPost.id == post_id)).first()
+    except SQLAlchemyError as error:
+        raise DatabaseError(f"Error retrieving record from {BlogPost.__tablename__}: {str(error)}")
+
+
+@replica_read
+def get_feed_state():
+    try:
+        return db.session.get(FeedState, 1)
+    except SQLAlchemyError as error:
+        raise DatabaseError(f"Error retrieving record from {FeedState.__tablename__}: {str(error)}")
+
+
+@replica_read
+def get_site_document(name):
+    try:
+        return db.session.get(SiteDocument, name)
+    except SQLAlchemyError as error:
+        raise DatabaseError(f"Error retrieving record from {SiteDocument.__tablename__}: {str(error)}")
+
+
+@replica_read
+def get_feed_posts(limit):
+    # The newest posts with their author, for the Atom feed.
+    try:
+        return db.session.execute(db.select(BlogPost).options(joinedload(BlogPost.author))
+                                  .order_by(BlogPost.id.desc()).limit(limit)).scalars().all()
+    except SQLAlchemyError as error:
+        raise DatabaseError(f"Error retrieving posts from {BlogPost.__tablename__}: {str(error)}")
+
+
+@replica_read
+def get_post_dates():
+    # (id, edited_at) of every post, for the sitemap. Posts stored before edited_at existed fall back to updated_at.
+    try:
+        return db.session.execute(db.select(BlogPost.id, db.func.coalesce(BlogPost.edited_at, BlogPost.updated_at))
+                                  .order_by(BlogPost.id)).all()
+    except SQLAlchemyError as error:
+        raise DatabaseError(f"Error retrieving posts from {BlogPost.__tablename__}: {str(error)}")
+
+
+@replica_read
+def get_user_dashboard(user_id, posts_page=1, comments_page=1, ratings_page=1, per_page=20):
+    # The user's posts, comments and ratings, one page each, with the titles of the posts they belong to.
+    # One query per section whatever the user's activity, the section total comes from a window count. A page
+    # past the end costs a count and the query again for the last page.
+    try:
+        def section(query, page):
+            page = max(page, 1)
+            items = db.session.execute(query.add_columns(db.func.count().over().label('total'))
+                                       .limit(per_page).offset((page - 1) * per_page)).all()
+            if not items and page > 1:
+                total = db.session.execute(db.select(db.func.count())
+                                           .select_from(query.order_by(None).subquery())).scalar_one()
+                return section(query, -(-total // per_page))
+            total = items[0].total if items else 0
+            return DashboardSection(items, page, max(1, -(-total // per_page)), total)
+
+        return {
+            'posts': section(db.select(BlogPost.id, BlogPost.title).where(BlogPost.author_id == user_id)
+                             .order_by(BlogPost.id.desc()), posts_page),
+            'comments': section(db.select(Comment.id, Comment.text, Comment.post_id, BlogPost.title)
+                                .join(BlogPost, Comment.post_id == BlogPost.id)
+                                .where(Comment.author_id == user_id).order_by(Comment.id.desc()),
+                                comments_page),
+            'ratings': section(db.select(Rating.id, Rating.value, Rating.post_id, BlogPost.title)
+                               .join(BlogPost, Rating.post_id == BlogPost.id)
+                               .where(Rating.author_id == user_id).order_by(Rating.id.desc()),
+                               ratings_page),
+        }
+    except SQLAlchemyError as error:
+        raise DatabaseError(f"Error retrieving the activity of user {user_id}: {str(error)}")
+
+
+@replica_read
 def get_user_by_email(email_id):
     try:
         return UserBlog.query.filter_by(email=email_id).first()
@@ -35,6 +184,8 @@ def get_user_by_email(email_id):
 
 
 def get_by_author_id(model, author_id, post_id):
+    # Checked before inserting a comment or rating, so it reads the primary: a lagging replica would let a
+    # second one through.
     try:
         return db.session.query(model).filter_by(author_id=author_id, post_id=post_id).first()
     except SQLAlchemyError as error:
@@ -42,6 +193,34 @@ def get_by_author_id(model, author_id, post_id):
             f"Error retrieving record from {model.__tablename__}: {str(error)}")
 
 
+@replica_read
+def get_permission_page(page=1, per_page=50):
+    # Users asking to post and users allowed to post, pending requests first, in one query: the total comes
+    # from a window count. Returns (requests, authors, total).
+    try:
+        rows = db.session.execute(
+            db.select(UserBlog.id, UserBlog.name, UserBlog.email, UserBlog.request, UserBlog.add_post,
+                      db.func.count().over().label('total'))
+            .where(db.or_(UserBlog.request.is_(True), UserBlog.add_post.is_(True)))
+            .order_by(UserBlog.request.desc(), UserBlog.id)
+            .limit(per_page).offset((max(page, 1) - 1) * per_page)).all()
+        requests = [row for row in rows if row.request]
+        authors = [row for row in rows if not row.request]
+        return requests, authors, rows[0].total if rows else 0
+    except SQLAlchemyError as error:
+        raise DatabaseError(f"Error retrieving records from {UserBlog.__tablename__}: {str(error)}")
+
+
+def get_all_for_update(model, ids):
+    # get_for_update for several rows in one query.
+    try:
+        return db.session.execute(db.select(model).where(model.id.in_(ids)).order_by(model.id).with_for_update()
+                                  .execution_options(populate_existing=True)).scalars().all()
+    except SQLAlchemyError as error:
+        raise DatabaseError(f"Error retrieving records from {model.__tablename__}: {str(error)}")
+
+
+@replica_read
 def get_by_condition(model, criteria, condition):
     try:
         if criteria == 'add_post':
@@ -54,10 +233,132 @@ def get_by_condition(model, criteria, condition):
             f"Error retrieving record(s) from {model.__tablename__}: {str(error)}")
 
 
+def adjust_rating_totals(post, count_delta, sum_delta):
+    # Applied as SQL expressions so concurrent rating writes can't overwrite each other's totals.
+    # The change is committed by the add/put/delete call that persists the rating itself.
+    post.rating_count = BlogPost.rating_count + count_delta
+    post.rating_sum = BlogPost.rating_sum + sum_delta
+
+
+def touch_post(post, edited=False):
+    post.version = BlogPost.version + 1
+    post.updated_at = utcnow()
+    if edited:
+        post.edited_at = post.updated_at
+
+
+def seed_feed_state():
+    # Run at startup, so the first post writes of two workers both find the row to update instead of
+    # both inserting it. Workers starting together can race here instead, the loser's insert is dropped.
+    try:
+        if db.session.get(FeedState, 1) is None:
+            db.session.add(FeedState(id=1, version=0, updated_at=utcnow()))
+            db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+    except SQLAlchemyError as error:
+        db.session.rollback()
+        raise DatabaseError(f"Error seeding {FeedState.__tablename__}: {str(error)}")
+
+
+def touch_feed():
+    # Call before the add/put/delete that commits the change to the list of posts. Read from the primary,
+    # a lagging replica could miss the row and the insert would collide. The row is seeded at startup.
+    state = db.session.get(FeedState, 1)
+    if state is None:
+        db.session.add(FeedState(id=1, version=1, updated_at=utcnow()))
+    else:
+        state.version = FeedState.version + 1
+        state.updated_at = utcnow()
+
+
+def recompute_rating_totals():
+    try:
+        count_query = db.select(db.func.count(Rating.id)).where(Rating.post_id == BlogPost.id).scalar_subquery()
+        sum_query = (db.select(db.func.coalesce(db.func.sum(Rating.value), 0))
+                     .where(Rating.post_id == BlogPost.id).scalar_subquery())
+        result = db.session.execute(db.update(BlogPost).values(rating_count=count_query, rating_sum=sum_query),
+                                    execution_options={'synchronize_session': False})
+        db.session.commit()
+        return result.rowcount
+    except SQLAlchemyError as error:
+        db.session.rollback()
+        raise DatabaseError(f"Error recomputing rating totals: {str(error)}")
+
+
+def backfill_avatar_hashes(hash_function, batch_size=500):
+    try:
+        updated = 0
+        while True:
+            users = db.session.execute(db.select(UserBlog).where(UserBlog.avatar_hash.is_(None))
+                                       .limit(batch_size)).scalars().all()
+            if not users:
+                return updated
+            for user in users:
+                user.avatar_hash = hash_function(user.email or '')
+            db.session.commit()
+            updated += len(users)
+    except SQLAlchemyError as error:
+        db.session.rollback()
+        raise DatabaseError(f"Error backfilling avatar hashes: {str(error)}")
+
+
+def _is_locked(error):
+    return isinstance(error, OperationalError) and 'locked' in str(error.orig).lower()
+
+
+def _snapshot(session):
+    # What the unit of work will write: new objects, changed column and many-to-one values, deleted objects.
+    changes = []
+    for instance in session.dirty:
+        state = inspect(instance)
+        values = {}
+        for attribute in state.mapper.attrs:
+            if not isinstance(attribute, ColumnProperty) and attribute.uselist:
+                continue
+            history = state.attrs[attribute.key].history
+            if history.added:
+                values[attribute.key] = history.added[0]
+        if values:
+            changes.append((instance, values))
+    return list(session.new), changes, list(session.deleted)
+
+
+def _replay(session, snapshot):
+    new, changes, deleted = snapshot
+    session.add_all(new)
+    for instance, values in changes:
+        for key, value in values.items():
+            setattr(instance, key, value)
+    for instance in deleted:
+        session.delete(instance)
+
+
+def _commit():
+    # Commits the session, retrying up to SQLITE_LOCK_RETRIES times with jittered backoff when SQLite reports
+    # the database locked. The lock is only contended for a transaction's first write: once a connection
+    # has written it holds the write lock until it commits, and in WAL mode readers never block a commit.
+    # So a locked commit has written nothing yet, and replaying the changes snapshotted here is complete.
+    # Counter updates such as adjust_rating_totals and touch_post are SQL expressions and replay safely.
+    retries = current_app.config.get('SQLITE_LOCK_RETRIES', 0)
+    snapshot = _snapshot(db.session) if retries else None
+    for attempt in range(retries + 1):
+        try:
+            db.session.commit()
+            return
+        except OperationalError as error:
+            if attempt == retries or not _is_locked(error):
+                raise
+            db.session.rollback()
+            backoff = current_app.config.get('SQLITE_LOCK_BACKOFF', 0.05)
+            time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+            _replay(db.session, snapshot)
+
+
 def add(entry):
     try:
         db.session.add(entry)
-        db.session.commit()
+        _commit()
     except IntegrityError:
         db.session.rollback()
         raise
@@ -68,7 +369,7 @@ def add(entry):
 
 def put():
     try:
-        db.session.commit()
+        _commit()
     except IntegrityError:
         db.session.rollback()
         raise
@@ -80,7 +381,7 @@ def put():
 def delete(record):
     try:
         db.session.delete(record)
-        db.session.commit()
+        _commit()
     except SQLAlchemyError as error:
         db.session.rollback()
         raise DatabaseError(f"Error deleting record: {str(error)}")
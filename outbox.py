@@ -0,0 +1,243 @@
+import asyncio
+import logging
+import threading
+from datetime import timedelta
+from email.mime.text import MIMEText
+import aiosmtplib
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from twilio.rest import Client
+from extensions import db
+from models.models import OutboxMessage, utcnow
+
+logger = logging.getLogger(__name__)
+
+
+def queue_email(subject, body, recipient=None):
+    # Added to the current session, committed by the caller's add()/put() together with the change it reports.
+    message = OutboxMessage(channel='email', subject=subject, body=body, recipient=recipient)
+    db.session.add(message)
+    return message
+
+
+def queue_sms(body):
+    message = OutboxMessage(channel='sms', body=body)
+    db.session.add(message)
+    return message
+
+
+def queue_sms_digest(coalesce_key, heading, line, window):
+    # Appends the line to the digest still waiting for its window, or opens a new digest due in `window`
+    # seconds. The update only matches a digest the sender has not claimed yet.
+    pending = (db.select(OutboxMessage.id)
+               .where(OutboxMessage.coalesce_key == coalesce_key, OutboxMessage.status == 'pending',
+                      OutboxMessage.attempts == 0)
+               .order_by(OutboxMessage.id.desc()).limit(1))
+    message_id = db.session.execute(pending).scalar()
+    if message_id is not None:
+        result = db.session.execute(db.update(OutboxMessage)
+                                    .where(OutboxMessage.id == message_id, OutboxMessage.status == 'pending')
+                                    .values(body=OutboxMessage.body + '\n' + line),
+                                    execution_options={'synchronize_session': False})
+        if result.rowcount:
+            return
+    db.session.add(OutboxMessage(channel='sms', subject=heading, body=line, coalesce_key=coalesce_key,
+                                 next_attempt_at=utcnow() + timedelta(seconds=window)))
+
+
+def sms_text(message):
+    if message.coalesce_key is None:
+        return message.body
+    lines = message.body.split('\n')
+    return f"{message.subject} ({len(lines)}):\n" + '\n'.join(lines)
+
+
+class TwilioTransport:
+    # One Twilio client per process, created on first use.
+    def __init__(self, config):
+        self.config = config
+        self._client = None
+
+    def send(self, body):
+        if self._client is None:
+            self._client = Client(self.config['TWILIO_ACCOUNT_SID'], self.config['TWILIO_AUTH_TOKEN'])
+        response = self._client.messages.create(body=body,
+                                                from_=self.config['TWILIO_PHONE_NUMBER'],
+                                                to=self.config['RECIPIENT_PHONE_NUMBER'])
+        logger.info("Text message sent. Status: %s", response.status)
+
+
+class Outbox:
+    def __init__(self):
+        self.app = None
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self.sms_transport = None
+
+    def init_app(self, app):
+        self.app = app
+        self.sms_transport = TwilioTransport(app.config)
+        app.extensions['outbox'] = self
+        if app.config.get('OUTBOX_WORKER', 'thread') == 'thread':
+            app.before_request(self.start)
+            if not event.contains(Session, 'after_commit', self._wake_after_commit):
+                event.listen(Session, 'after_flush', self._note_queued)
+                event.listen(Session, 'after_commit', self._wake_after_commit)
+
+    @staticmethod
+    def _note_queued(session, flush_context):
+        if any(isinstance(instance, OutboxMessage) for instance in session.new):
+            session.info['outbox_queued'] = True
+
+    def _wake_after_commit(self, session):
+        if session.info.pop('outbox_queued', False):
+            self.wake()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run, name='outbox-sender', daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        self.start()
+        self._wakeup.set()
+
+    def run(self, once=False):
+        while True:
+            self._wakeup.clear()
+            with self.app.app_context():
+                try:
+                    while self.deliver_due():
+                        pass
+                except Exception:
+                    # Anything escaping a batch would end the thread and stop all delivery.
+                    db.session.rollback()
+                    logger.exception("Outbox delivery failed")
+                finally:
+                    db.session.remove()
+            if once:
+                return
+            self._wakeup.wait(self.app.config['OUTBOX_POLL_INTERVAL'])
+
+    def deliver_due(self):
+        messages = self._claim()
+        if not messages:
+            return 0
+
+        emails = [message for message in messages if message.channel == 'email']
+        errors = asyncio.run(self._send_emails(emails)) if emails else {}
+        for message in messages:
+            if message.channel == 'sms':
+                errors[message.id] = self._send_sms(message)
+
+        for message in messages:
+            self._finish(message, errors.get(message.id))
+        db.session.commit()
+        return len(messages)
+
+    def _claim(self):
+        # Rows are claimed with a conditional update so several workers can share the table. Claims older
+        # than OUTBOX_CLAIM_TIMEOUT belong to a sender that died mid-batch and are taken over.
+        config = self.app.config
+        now = utcnow()
+        stale = now - timedelta(seconds=config['OUTBOX_CLAIM_TIMEOUT'])
+        due = (db.or_(db.and_(OutboxMessage.status == 'pending', OutboxMessage.next_attempt_at <= now),
+                      db.and_(OutboxMessage.status == 'sending', OutboxMessage.claimed_at < stale)))
+        candidates = db.session.execute(db.select(OutboxMessage.id).where(due).order_by(OutboxMessage.id)
+                                        .limit(config['OUTBOX_BATCH_SIZE'])).scalars().all()
+        claimed = []
+        for message_id in candidates:
+            result = db.session.execute(db.update(OutboxMessage)
+                                        .where(OutboxMessage.id == message_id, due)
+                                        .values(status='sending', claimed_at=now),
+                                        execution_options={'synchronize_session': False})
+            if result.rowcount:
+                claimed.append(message_id)
+        db.session.commit()
+        if not claimed:
+            return []
+        return db.session.execute(db.select(OutboxMessage).where(OutboxMessage.id.in_(claimed))
+                                  .order_by(OutboxMessage.id)).scalars().all()
+
+    def _finish(self, message, error):
+        config = self.app.config
+        message.attempts += 1
+        message.claimed_at = None
+        if error is None:
+            message.status = 'sent'
+            message.last_error = None
+            return
+
+        message.last_error = error
+        if message.attempts >= config['OUTBOX_MAX_ATTEMPTS']:
+            message.status = 'failed'
+            logger.error("Giving up on %s message %s: %s", message.channel, message.id, error)
+            if message.channel == 'sms':
+                queue_email("An error occurred while sending a text message",
+                            f"An error occurred while sending a text notification:\n{error}.\n"
+                            f"Message:\n{sms_text(message)}\nCheck logs.")
+            return
+
+        delay = min(config['OUTBOX_RETRY_BASE'] * 2 ** (message.attempts - 1), config['OUTBOX_RETRY_MAX'])
+        message.status = 'pending'
+        message.next_attempt_at = utcnow() + timedelta(seconds=delay)
+
+    def _build_email(self, message):
+        config = self.app.config
+        msg = MIMEText(message.body, 'plain', 'utf-8')
+        msg['Subject'] = message.subject
+        msg['From'] = config['EMAIL_USERNAME']
+        msg['To'] = message.recipient or config['EMAIL_USERNAME']
+        return msg
+
+    async def _send_emails(self, messages):
+        # One SMTP session for the whole batch.
+        config = self.app.config
+        smtp = aiosmtplib.SMTP(hostname=config['EMAIL_HOST'],
+                               port=config['EMAIL_PORT'],
+                               start_tls=config['EMAIL_START_TLS'],
+                               username=config['EMAIL_USERNAME'] if config['EMAIL_PASSWORD'] else None,
+                               password=config['EMAIL_PASSWORD'],
+                               timeout=config['EMAIL_TIMEOUT'])
+        try:
+            await smtp.connect()
+        except Exception as error:
+            return {message.id: f"SMTP connection failed: {error}" for message in messages}
+
+        errors = {}
+        sent = set()
+        try:
+            for message in messages:
+                try:
+                    await smtp.send_message(self._build_email(message))
+                    sent.add(message.id)
+                except aiosmtplib.SMTPServerDisconnected as error:
+                    errors[message.id] = str(error)
+                    await smtp.connect()
+                except Exception as error:
+                    errors[message.id] = str(error)
+        except Exception as error:
+            for message in messages:
+                if message.id not in sent:
+                    errors.setdefault(message.id, str(error))
+        finally:
+            if smtp.is_connected:
+                try:
+                    await smtp.quit()
+                except aiosmtplib.SMTPException:
+                    smtp.close()
+        return errors
+
+    def _send_sms(self, message):
+        try:
+            self.sms_transport.send(sms_text(message))
+            return None
+        except Exception as error:
+            return str(error)
+
+
+outbox = Outbox()
@@ -0,0 +1,56 @@
+from sqlalchemy import event
+from extensions import db
+
+JOURNAL_MODES = ('WAL', 'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY')
+SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+class SQLitePragmas:
+    # Production settings for SQLite databases, applied to every new connection of every SQLite engine (the
+    # primary and any replica). WAL lets readers run while a writer commits, synchronous=NORMAL only syncs
+    # the WAL at checkpoints, busy_timeout makes a writer wait for the lock instead of failing straight
+    # away, and mmap_size/cache_size keep the hot pages in memory. Disabled with SQLITE_PRAGMAS=false.
+    def __init__(self):
+        self.enabled = False
+        self.pragmas = []
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config.get('SQLITE_PRAGMAS', False)
+        app.extensions['sqlite_pragmas'] = self
+        if not self.enabled:
+            return
+        journal_mode = config['SQLITE_JOURNAL_MODE'].upper()
+        synchronous = config['SQLITE_SYNCHRONOUS'].upper()
+        if journal_mode not in JOURNAL_MODES:
+            raise ValueError(f"Unsupported SQLITE_JOURNAL_MODE: {journal_mode}")
+        if synchronous not in SYNCHRONOUS_LEVELS:
+            raise ValueError(f"Unsupported SQLITE_SYNCHRONOUS: {synchronous}")
+        self.pragmas = [
+            f"PRAGMA journal_mode={journal_mode}",
+            f"PRAGMA synchronous={synchronous}",
+            f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT'])}",
+            f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}",
+            f"PRAGMA cache_size={int(config['SQLITE_CACHE_SIZE'])}",
+            "PRAGMA temp_store=MEMORY",
+        ]
+        with app.app_context():
+            for engine in db.engines.values():
+                if engine.dialect.name == 'sqlite' and not event.contains(engine, 'connect', self._connect):
+                    event.listen(engine, 'connect', self._connect)
+
+    def _connect(self, dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in self.pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+    def settings(self, connection):
+        # The values in effect on `connection`, for checking a deployment.
+        return {name: connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+                for name in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size', 'cache_size')}
+
+
+sqlite_pragmas = SQLitePragmas()
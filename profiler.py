@@ -0,0 +1,172 @@
+import cProfile
+import inspect
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from io import StringIO
+from urllib.parse import parse_qs
+from flask import request
+from admin import ADMIN_ID, is_admin
+
+PROFILE_ID = re.compile(r'^[0-9]{8}-[0-9]{6}-[0-9a-f]{8}$')
+SORT_KEYS = ('cumulative', 'tottime', 'ncalls')
+
+
+class ProfilerMiddleware:
+    # Profiles whole WSGI requests: routing, session and user loading, the view, the ORM, template rendering
+    # and outbound calls made while handling the request. A request is profiled when it is sampled, or when it
+    # carries the profile flag and its signed session cookie names the admin; that check reads no database, so
+    # anyone else's flag costs one cookie decode. The profile stops when the application returns; a streamed
+    # body is produced after that, so those requests are not kept.
+    def __init__(self, app, profiler):
+        self.app = app
+        self.wsgi_app = app.wsgi_app
+        self.profiler = profiler
+
+    def __call__(self, environ, start_response):
+        if self.profiler.sampled():
+            trigger = 'sampled'
+        elif self.requested(environ) and self.admin_session(environ):
+            trigger = 'requested'
+        else:
+            return self.wsgi_app(environ, start_response)
+
+        status = {}
+
+        def capture_status(status_line, headers, exc_info=None):
+            status['code'] = int(status_line.split(' ', 1)[0])
+            return start_response(status_line, headers, exc_info)
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is running in this process (Python 3.12+ allows one at a time).
+            return self.wsgi_app(environ, start_response)
+        environ['profiler.trigger'] = trigger
+        start = time.perf_counter()
+        try:
+            app_iter = self.wsgi_app(environ, capture_status)
+        finally:
+            profile.disable()
+        elapsed = time.perf_counter() - start
+
+        # A requested profile is only kept once the request itself has confirmed the admin, see Profiler._check.
+        if not environ.get('profiler.streamed') and (trigger == 'sampled' or environ.get('profiler.admin')):
+            self.profiler.save(profile, {
+                'method': environ.get('REQUEST_METHOD'),
+                'path': environ.get('PATH_INFO'),
+                'query': environ.get('QUERY_STRING', ''),
+                'status': status.get('code'),
+                'duration_ms': round(elapsed * 1000, 2),
+                'trigger': trigger,
+            })
+        return app_iter
+
+    @staticmethod
+    def requested(environ):
+        return (environ.get('HTTP_X_PROFILE') == '1'
+                or parse_qs(environ.get('QUERY_STRING', '')).get('_profile') == ['1'])
+
+    def admin_session(self, environ):
+        session = self.app.session_interface.open_session(self.app, self.app.request_class(environ))
+        return session is not None and session.get('_user_id') == str(ADMIN_ID)
+
+
+class Profiler:
+    # Admin-only request profiling, enabled by PROFILER_ENABLED. Admins profile a request with an
+    # `X-Profile: 1` header or a `_profile=1` query argument, PROFILER_SAMPLE_RATE profiles that fraction of
+    # all traffic. When disabled nothing is installed: no middleware, no request hooks.
+    def __init__(self):
+        self.enabled = False
+        self.directory = None
+        self.sample_rate = 0.0
+        self.keep = 100
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('PROFILER_ENABLED', False)
+        self.directory = app.config['PROFILER_DIR']
+        self.sample_rate = app.config.get('PROFILER_SAMPLE_RATE', 0.0)
+        self.keep = app.config.get('PROFILER_KEEP', 100)
+        app.extensions['profiler'] = self
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        app.wsgi_app = ProfilerMiddleware(app, self)
+        app.before_request(self._check)
+        app.after_request(self._finish)
+
+    def sampled(self):
+        return bool(self.sample_rate) and random.random() < self.sample_rate
+
+    @staticmethod
+    def _check():
+        # The cookie check only proves the session was signed for the admin, confirm the admin user here.
+        if request.environ.get('profiler.trigger') == 'requested':
+            request.environ['profiler.admin'] = is_admin()
+
+    @staticmethod
+    def _finish(response):
+        # A body produced by a generator is only built after the middleware's profile stops, it would miss it.
+        request.environ['profiler.streamed'] = inspect.isgenerator(response.response)
+        return response
+
+    def save(self, profile, metadata):
+        profile_id = time.strftime('%Y%m%d-%H%M%S', time.gmtime()) + '-' + uuid.uuid4().hex[:8]
+        metadata = dict(metadata, id=profile_id, created=time.time())
+        path = os.path.join(self.directory, profile_id)
+        profile.dump_stats(path + '.pstats')
+        with open(path + '.json', 'w') as file:
+            json.dump(metadata, file)
+        self._prune()
+        return profile_id
+
+    def _prune(self):
+        with self._lock:
+            profiles = sorted(name[:-5] for name in os.listdir(self.directory) if name.endswith('.json'))
+            for profile_id in profiles[:-self.keep] if self.keep else []:
+                for extension in ('.json', '.pstats'):
+                    try:
+                        os.remove(os.path.join(self.directory, profile_id + extension))
+                    except OSError:
+                        pass
+
+    def list(self):
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            if name.endswith('.json'):
+                try:
+                    with open(os.path.join(self.directory, name)) as file:
+                        profiles.append(json.load(file))
+                except (OSError, ValueError):
+                    continue
+        return profiles
+
+    def path(self, profile_id):
+        if not PROFILE_ID.match(profile_id):
+            return None
+        path = os.path.join(self.directory, profile_id + '.pstats')
+        return path if os.path.exists(path) else None
+
+    def report(self, profile_id, sort='cumulative', limit=60):
+        # The pstats table of a stored profile, or None when there is no such profile.
+        path = self.path(profile_id)
+        if path is None or sort not in SORT_KEYS:
+            return None
+        with open(os.path.join(self.directory, profile_id + '.json')) as file:
+            metadata = json.load(file)
+        output = StringIO()
+        stats = pstats.Stats(path, stream=output)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        return metadata, output.getvalue()
+
+
+profiler = Profiler()
@@ -0,0 +1,127 @@
+import os
+import sqlite3
+import threading
+import time
+from limits.storage import Storage, MovingWindowSupport
+
+
+class SQLiteStorage(Storage, MovingWindowSupport):
+    # Rate limit storage in a local SQLite file, shared by every worker process on the host. Each operation
+    # runs in a BEGIN IMMEDIATE transaction so check-and-increment is atomic across processes; expired rows
+    # are swept periodically so the file only holds live windows.
+    # URI: sqlite:///relative/path.db or sqlite:////absolute/path.db
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri=None, wrap_exceptions=False, timeout=5.0, sweep_interval=60, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.path = uri[len("sqlite:///"):] if uri and uri.startswith("sqlite:///") else "ratelimit.db"
+        self.timeout = float(timeout)
+        self.sweep_interval = float(sweep_interval)
+        self._local = threading.local()
+        self._last_sweep = 0.0
+        self._connection().executescript("""
+            CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY, value INTEGER NOT NULL, expires REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS events (key TEXT NOT NULL, ts REAL NOT NULL, expires REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS ix_events_key_ts ON events (key, ts);
+            CREATE INDEX IF NOT EXISTS ix_events_expires ON events (expires);
+            CREATE INDEX IF NOT EXISTS ix_counters_expires ON counters (expires);
+        """)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connection(self):
+        # One connection per thread and process, a connection inherited across a fork is not reused.
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _transaction(self, work):
+        connection = self._connection()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            result = work(connection, now)
+            if now - self._last_sweep >= self.sweep_interval:
+                connection.execute("DELETE FROM events WHERE expires <= ?", (now,))
+                connection.execute("DELETE FROM counters WHERE expires <= ?", (now,))
+                self._last_sweep = now
+            connection.execute("COMMIT")
+            return result
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def incr(self, key, expiry, amount=1, **_):
+        def work(connection, now):
+            row = connection.execute("SELECT value, expires FROM counters WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] <= now:
+                value, expires = amount, now + expiry
+            else:
+                value, expires = row[0] + amount, row[1]
+            connection.execute("INSERT OR REPLACE INTO counters (key, value, expires) VALUES (?, ?, ?)",
+                               (key, value, expires))
+            return value
+
+        return self._transaction(work)
+
+    def get(self, key):
+        row = self._connection().execute("SELECT value FROM counters WHERE key = ? AND expires > ?",
+                                         (key, time.time())).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        row = self._connection().execute("SELECT expires FROM counters WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else time.time()
+
+    def acquire_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+
+        def work(connection, now):
+            connection.execute("DELETE FROM events WHERE key = ? AND ts <= ?", (key, now - expiry))
+            count = connection.execute("SELECT COUNT(*) FROM events WHERE key = ?", (key,)).fetchone()[0]
+            if count + amount > limit:
+                return False
+            connection.executemany("INSERT INTO events (key, ts, expires) VALUES (?, ?, ?)",
+                                   [(key, now, now + expiry)] * amount)
+            return True
+
+        return self._transaction(work)
+
+    def get_moving_window(self, key, limit, expiry):
+        now = time.time()
+        oldest, count = self._connection().execute(
+            "SELECT MIN(ts), COUNT(*) FROM events WHERE key = ? AND ts > ?", (key, now - expiry)).fetchone()
+        return (oldest if count else now), count
+
+    def check(self):
+        try:
+            self._connection().execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        def work(connection, now):
+            removed = connection.execute("DELETE FROM counters").rowcount
+            removed += connection.execute("DELETE FROM events").rowcount
+            return removed
+
+        return self._transaction(work)
+
+    def clear(self, key):
+        def work(connection, now):
+            connection.execute("DELETE FROM counters WHERE key = ?", (key,))
+            connection.execute("DELETE FROM events WHERE key = ?", (key,))
+
+        self._transaction(work)
@@ -0,0 +1,135 @@
+import logging
+import threading
+import time
+from collections import deque
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    # Opens after `threshold` consecutive failures, lets a single trial call through once `reset_timeout`
+    # seconds have passed and closes again when that call succeeds.
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class RecaptchaVerifier:
+    def __init__(self):
+        self.session = None
+        self.breaker = None
+        self.latencies = deque(maxlen=500)
+        self.calls = 0
+        self.errors = 0
+        self.short_circuited = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.url = app.config['RECAPTCHA_VERIFY_URL']
+        self.secret = app.config['RECAPTCHA_SECRET_KEY']
+        self.timeout = (app.config['RECAPTCHA_CONNECT_TIMEOUT'], app.config['RECAPTCHA_READ_TIMEOUT'])
+        self.fail_open = app.config['RECAPTCHA_FAIL_OPEN']
+        self.breaker = CircuitBreaker(app.config['RECAPTCHA_BREAKER_THRESHOLD'], app.config['RECAPTCHA_BREAKER_RESET'])
+
+        # Keep-alive connections are reused across verifications, no retries so the timeouts stay the budget.
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=app.config['RECAPTCHA_POOL_SIZE'], max_retries=0)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        app.extensions['recaptcha'] = self
+
+    def verify(self, recaptcha_response, remote_ip=None):
+        # Returns whether the token is valid. When Google can't be reached in time, or the breaker is open,
+        # the answer is the configured fail-open/fail-closed policy.
+        if not self.breaker.allow():
+            self._count('short_circuited')
+            return self.fail_open
+
+        payload = {'secret': self.secret, 'response': recaptcha_response}
+        if remote_ip:
+            payload['remoteip'] = remote_ip
+
+        start = time.perf_counter()
+        try:
+            response = self.session.post(self.url, data=payload, timeout=self.timeout)
+            response.raise_for_status()
+            result = response.json()
+        except (requests.RequestException, ValueError) as error:
+            self._record(time.perf_counter() - start, failed=True)
+            self.breaker.record_failure()
+            logger.warning("reCAPTCHA verification failed (%s), breaker %s", error, self.breaker.state)
+            return self.fail_open
+
+        self._record(time.perf_counter() - start)
+        self.breaker.record_success()
+        return result.get("success", False)
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            calls, errors, short_circuited = self.calls, self.errors, self.short_circuited
+
+        def percentile(fraction):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000, 2)
+
+        return {
+            'calls': calls,
+            'errors': errors,
+            'short_circuited': short_circuited,
+            'breaker': self.breaker.state if self.breaker else None,
+            'fail_open': self.fail_open if self.breaker else None,
+            'latency_ms_p50': percentile(0.5),
+            'latency_ms_p95': percentile(0.95),
+            'latency_ms_max': percentile(1.0),
+        }
+
+    def _record(self, elapsed, failed=False):
+        logger.info("reCAPTCHA verification took %.1f ms", elapsed * 1000)
+        with self._lock:
+            self.calls += 1
+            if failed:
+                self.errors += 1
+            self.latencies.append(elapsed)
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
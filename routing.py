@@ -0,0 +1,49 @@
+import random
+import time
+from flask import current_app, has_request_context, session as http_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA_PREFIX = 'replica'
+
+
+class RoutingSession(Session):
+    # Sends statements issued inside a models.transactions.replica_read helper to a replica bind, everything
+    # else to the primary. Once the session has written, its later reads stay on the primary so a request
+    # reads its own writes; with REPLICA_PIN_SECONDS the browser that wrote keeps reading from the primary
+    # while the replicas catch up.
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and (self._flushing or isinstance(clause, UpdateBase)):
+            self._mark_write()
+        elif bind is None and self.info.get('replica_read'):
+            replica = self._replica()
+            if replica is not None and self._replica_allowed():
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _mark_write(self):
+        if self.info.get('wrote'):
+            return
+        self.info['wrote'] = True
+        pin = current_app.config.get('REPLICA_PIN_SECONDS', 0)
+        if pin and has_request_context() and self._replicas():
+            http_session['_primary_until'] = int(time.time() + pin)
+
+    def _replica_allowed(self):
+        if self.info.get('wrote'):
+            return False
+        if has_request_context() and http_session.get('_primary_until', 0) > time.time():
+            return False
+        return True
+
+    def _replicas(self):
+        return [engine for key, engine in self._db.engines.items()
+                if key is not None and key.startswith(REPLICA_PREFIX)]
+
+    def _replica(self):
+        # One replica per session, so a request sees a single consistent snapshot.
+        if 'replica' not in self.info:
+            replicas = self._replicas()
+            self.info['replica'] = random.choice(replicas) if replicas else None
+        return self.info['replica']
+
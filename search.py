@@ -0,0 +1,200 @@
+import html
+import re
+from markupsafe import Markup
+from sqlalchemy import event, inspect, text
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from sqlalchemy.orm import Session
+from extensions import db
+from models.models import BlogPost, UserBlog
+from models.transactions import DatabaseError, replica_read
+from utils import html_to_text
+
+# Snippet highlight delimiters, swapped for <mark> once the snippet has been escaped.
+MARK_START = '\x02'
+MARK_END = '\x03'
+INDEXED_FIELDS = ('title', 'subtitle', 'body')
+
+
+def document(post):
+    # Titles and subtitles are stored HTML-escaped by sanitize_input, the body is CKEditor HTML.
+    return {'post_id': post.id, 'title': html.unescape(post.title or ''),
+            'subtitle': html.unescape(post.subtitle or ''), 'body': html_to_text(post.body)}
+
+
+def highlight(snippet):
+    escaped = html.escape(snippet or '')
+    return Markup(escaped.replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+
+class SQLiteBackend:
+    # FTS5 table keyed by the post id, ranked with bm25 weighting title over subtitle over body.
+    name = 'sqlite-fts5'
+
+    def create(self, connection):
+        connection.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS post_search USING "
+                                "fts5(title, subtitle, body, tokenize='porter unicode61')"))
+
+    def drop(self, connection):
+        connection.execute(text("DROP TABLE IF EXISTS post_search"))
+
+    def upsert(self, connection, documents):
+        connection.execute(text("DELETE FROM post_search WHERE rowid = :post_id"), documents)
+        connection.execute(text("INSERT INTO post_search (rowid, title, subtitle, body) "
+                                "VALUES (:post_id, :title, :subtitle, :body)"), documents)
+
+    def remove(self, connection, post_ids):
+        connection.execute(text("DELETE FROM post_search WHERE rowid = :post_id"),
+                           [{'post_id': post_id} for post_id in post_ids])
+
+    def search(self, connection, query, limit, offset):
+        terms = re.findall(r'\w+', query)
+        if not terms:
+            return []
+        match = ' '.join(f'"{term}"*' for term in terms)
+        return connection.execute(text(
+            "SELECT p.id, p.title, p.subtitle, p.date, u.name AS author_name, "
+            f"snippet(post_search, 2, '{MARK_START}', '{MARK_END}', '…', 24) AS snippet "
+            "FROM post_search JOIN blog_posts p ON p.id = post_search.rowid "
+            "LEFT JOIN users_blog u ON u.id = p.author_id "
+            "WHERE post_search MATCH :match "
+            "ORDER BY bm25(post_search, 10.0, 5.0, 1.0) LIMIT :limit OFFSET :offset"),
+            {'match': match, 'limit': limit, 'offset': offset}).mappings().all()
+
+
+class PostgresBackend:
+    # Weighted tsvector per post behind a GIN index, ts_headline for snippets.
+    name = 'postgres-tsvector'
+
+    def create(self, connection):
+        connection.execute(text("CREATE TABLE IF NOT EXISTS post_search ("
+                                "post_id INTEGER PRIMARY KEY REFERENCES blog_posts (id) ON DELETE CASCADE, "
+                                "body TEXT NOT NULL, document TSVECTOR NOT NULL)"))
+        connection.execute(text("CREATE INDEX IF NOT EXISTS ix_post_search_document "
+                                "ON post_search USING GIN (document)"))
+
+    def drop(self, connection):
+        connection.execute(text("DROP TABLE IF EXISTS post_search"))
+
+    def upsert(self, connection, documents):
+        connection.execute(text(
+            "INSERT INTO post_search (post_id, body, document) VALUES (:post_id, :body, "
+            "setweight(to_tsvector('english', :title), 'A') || setweight(to_tsvector('english', :subtitle), 'B') "
+            "|| setweight(to_tsvector('english', :body), 'C')) "
+            "ON CONFLICT (post_id) DO UPDATE SET body = EXCLUDED.body, document = EXCLUDED.document"), documents)
+
+    def remove(self, connection, post_ids):
+        connection.execute(text("DELETE FROM post_search WHERE post_id = ANY(:post_ids)"),
+                           {'post_ids': list(post_ids)})
+
+    def search(self, connection, query, limit, offset):
+        return connection.execute(text(
+            "SELECT p.id, p.title, p.subtitle, p.date, u.name AS author_name, "
+            "ts_headline('english', s.body, q, :options) AS snippet "
+            "FROM post_search s, websearch_to_tsquery('english', :query) q, blog_posts p "
+            "LEFT JOIN users_blog u ON u.id = p.author_id "
+            "WHERE p.id = s.post_id AND s.document @@ q "
+            "ORDER BY ts_rank_cd(s.document, q) DESC LIMIT :limit OFFSET :offset"),
+            {'query': query, 'limit': limit, 'offset': offset,
+             'options': f'StartSel={MARK_START}, StopSel={MARK_END}, MaxWords=35, MinWords=15'}).mappings().all()
+
+
+class LikeBackend:
+    # Fallback for databases without a full-text engine: unranked substring matching, nothing to maintain.
+    name = 'like'
+
+    def create(self, connection):
+        pass
+
+    def drop(self, connection):
+        pass
+
+    def upsert(self, connection, documents):
+        pass
+
+    def remove(self, connection, post_ids):
+        pass
+
+    def search(self, connection, query, limit, offset):
+        pattern = f"%{query}%"
+        rows = connection.execute(
+            db.select(BlogPost.id, BlogPost.title, BlogPost.subtitle, BlogPost.date,
+                      UserBlog.name.label('author_name'), BlogPost.body)
+            .outerjoin(UserBlog, BlogPost.author_id == UserBlog.id)
+            .where(db.or_(BlogPost.title.ilike(pattern), BlogPost.subtitle.ilike(pattern),
+                          BlogPost.body.ilike(pattern)))
+            .order_by(BlogPost.id.desc()).limit(limit).offset(offset)).mappings().all()
+        return [dict(row, snippet=html_to_text(row['body'])[:200]) for row in rows]
+
+
+class SearchIndex:
+    def __init__(self):
+        self.backend = None
+
+    def init_app(self, app):
+        app.extensions['search'] = self
+        if not event.contains(Session, 'after_flush', self._after_flush):
+            event.listen(Session, 'after_flush', self._after_flush)
+
+    def create(self):
+        # Picks the backend for the configured database and creates its index if missing.
+        dialect = db.engine.dialect.name
+        backend = {'sqlite': SQLiteBackend, 'postgresql': PostgresBackend}.get(dialect, LikeBackend)()
+        try:
+            with db.engine.begin() as connection:
+                backend.create(connection)
+        except OperationalError:
+            # SQLite built without FTS5.
+            backend = LikeBackend()
+        self.backend = backend
+
+    def _after_flush(self, session, flush_context):
+        # Every flush that creates, edits or deletes a post updates its index entry in the same transaction,
+        # so the index follows add_new_post, edit_post and delete_post without rescanning.
+        if self.backend is None:
+            return
+        changed = [instance for instance in list(session.new) + list(session.dirty)
+                   if isinstance(instance, BlogPost) and self._text_changed(instance)]
+        deleted = [instance.id for instance in session.deleted if isinstance(instance, BlogPost)]
+        connection = session.connection()
+        if changed:
+            self.backend.upsert(connection, [document(post) for post in changed])
+        if deleted:
+            self.backend.remove(connection, deleted)
+
+    @staticmethod
+    def _text_changed(post):
+        state = inspect(post)
+        return state.pending or any(state.attrs[field].history.has_changes() for field in INDEXED_FIELDS)
+
+    def index(self, posts):
+        # For writes that bypass the session, like bulk inserts: `posts` need id, title, subtitle and body.
+        if self.backend is not None and posts:
+            self.backend.upsert(db.session.connection(), [document(post) for post in posts])
+
+    @replica_read
+    def search(self, query, limit=10, offset=0):
+        try:
+            rows = self.backend.search(db.session.connection(), query, limit, offset)
+            return [dict(row, snippet=highlight(row['snippet'])) for row in rows]
+        except SQLAlchemyError as error:
+            db.session.rollback()
+            raise DatabaseError(f"Error searching posts: {str(error)}")
+
+    def rebuild(self, batch_size=500):
+        try:
+            with db.engine.begin() as connection:
+                self.backend.drop(connection)
+                self.backend.create(connection)
+                indexed = 0
+                posts = connection.execute(db.select(BlogPost.id, BlogPost.title, BlogPost.subtitle, BlogPost.body)
+                                           .execution_options(yield_per=batch_size))
+                for batch in posts.partitions():
+                    self.backend.upsert(connection, [document(post) for post in batch])
+                    indexed += len(batch)
+            return indexed
+        except SQLAlchemyError as error:
+            db.session.rollback()
+            raise DatabaseError(f"Error rebuilding the search index: {str(error)}")
+
+
+search_index = SearchIndex()
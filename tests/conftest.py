@@ -0,0 +1,67 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Config reads the environment when it is imported, so this has to come before the app.
+DIRECTORY = tempfile.mkdtemp(prefix='the-blog-tests-')
+# The page cache is off: it lives for the whole session, and the same page versions recur in every test's database.
+# No outbox thread either, tests deliver with outbox.deliver_due().
+os.environ.update(DB_URI=f"sqlite:///{os.path.join(DIRECTORY, 'blog.db')}", F_KEY='tests', PAGE_CACHE_BACKEND='none',
+                  OUTBOX_WORKER='off')
+
+from app import create_app  # noqa: E402
+from extensions import db, limiter  # noqa: E402
+from usercache import user_cache  # noqa: E402
+from models.models import UserBlog, BlogPost, Comment  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app = create_app()
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    limiter.enabled = False
+    return flask_app
+
+
+@pytest.fixture(autouse=True)
+def database(app):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    # Ids start over with every database, so must the logged-in users' snapshots.
+    user_cache.invalidate(*list(user_cache._entries))
+    yield
+    with app.app_context():
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def login(client, user_id):
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+
+
+def create_post(app, comments=0, title='A post'):
+    """A post by a fresh author with `comments` comments, each by a different user. Returns the post id."""
+    with app.app_context():
+        author = UserBlog(email=f"author-{title}@example.com", name='Author', password='x', add_post=True)
+        post = BlogPost(title=title, subtitle='Subtitle', date='May 01, 2024', body='<p>Body</p>',
+                        img_url='https://example.com/header.jpg', author=author)
+        commenters = [UserBlog(email=f"reader-{title}-{number}@example.com", name=f"Reader {number}", password='x')
+                      for number in range(comments)]
+        db.session.add_all([post] + commenters)
+        db.session.flush()
+        db.session.add_all([Comment(text=f"<p>Comment {number}</p>", author_id=commenter.id, post_id=post.id)
+                            for number, commenter in enumerate(commenters)])
+        db.session.commit()
+        return post.id
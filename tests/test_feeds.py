@@ -0,0 +1,36 @@
+import re
+from datetime import datetime
+
+from extensions import db
+from models.models import BlogPost
+from models.transactions import touch_post, touch_feed
+from conftest import create_post
+
+
+def lastmods(client):
+    sitemap = client.get('/sitemap.xml').get_data(as_text=True)
+    return dict(re.findall(r'/post/(\d+)</loc><lastmod>([^<]+)</lastmod>', sitemap))
+
+
+def test_feed_and_sitemap_dates_follow_post_edits_only(app, client):
+    commented, edited = create_post(app, title='Commented'), create_post(app, title='Edited')
+    with app.app_context():
+        for post in db.session.scalars(db.select(BlogPost)):
+            post.edited_at = post.updated_at = datetime(2024, 5, 1)
+        touch_feed()
+        db.session.commit()
+    assert lastmods(client) == {str(commented): '2024-05-01T00:00:00+00:00', str(edited): '2024-05-01T00:00:00+00:00'}
+
+    with app.app_context():
+        # A comment moves the post's version and updated_at, then an edit of the other post rebuilds the documents.
+        touch_post(db.session.get(BlogPost, commented))
+        db.session.commit()
+        touch_post(db.session.get(BlogPost, edited), edited=True)
+        touch_feed()
+        db.session.commit()
+
+    dates = lastmods(client)
+    assert dates[str(commented)] == '2024-05-01T00:00:00+00:00'
+    assert dates[str(edited)] > '2024-05-01T00:00:00+00:00'
+    feed = client.get('/feed.xml').get_data(as_text=True)
+    assert feed.count('<updated>2024-05-01T00:00:00+00:00</updated>') == 1
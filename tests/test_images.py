@@ -0,0 +1,21 @@
+from extensions import db
+from images import images
+from models.models import BlogPost
+from conftest import create_post
+
+
+def test_masthead_uses_static_files_and_decodes_stored_urls(app, client, monkeypatch):
+    monkeypatch.setattr(images, 'manifest', {})
+    with app.test_request_context():
+        assert 'url("/static/assets/img/home-bg.jpg")' in images.masthead_style('home-bg.jpg')
+        # Not a file in static/assets/img, so used as given even without a slash.
+        assert 'url("header.jpg")' in images.masthead_style('header.jpg')
+
+    post_id = create_post(app)
+    with app.app_context():
+        post = db.session.get(BlogPost, post_id)
+        # As sanitize_input stores it.
+        post.img_url = 'https://images.example.com/photo?w=1600&amp;q=80&amp;fit=crop'
+        db.session.commit()
+    page = client.get(f'/post/{post_id}').get_data(as_text=True)
+    assert 'url("https://images.example.com/photo?w=1600&q=80&fit=crop")' in page
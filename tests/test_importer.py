@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from extensions import db
+from importer import Importer, ImportFormatError
+from models.models import BlogPost, Comment, Rating, UserBlog
+
+
+def write_posts(path, broken=None):
+    with open(path, 'w') as file:
+        for number in range(6):
+            record = {'title': f"Post {number}", 'body': f"<p>Body {number}</p>", 'author': 'writer@example.com',
+                      'comments': [{'author': 'reader@example.com', 'text': f"<p>Comment {number}</p>"}],
+                      'ratings': [{'author': 'reader@example.com', 'value': 4}]}
+            if number == broken:
+                record['ratings'][0]['value'] = 11
+            file.write(json.dumps(record) + '\n')
+
+
+def rows(app):
+    with app.app_context():
+        return {model.__tablename__: db.session.scalar(db.select(db.func.count()).select_from(model))
+                for model in (UserBlog, BlogPost, Comment, Rating)}
+
+
+def run(app, path, **options):
+    with app.app_context():
+        return Importer(batch_size=2, **options).run(str(path))
+
+
+def test_failed_import_resumes_from_the_checkpoint(app, tmp_path):
+    source, checkpoint = tmp_path / 'posts.ndjson', tmp_path / 'checkpoint.json'
+    write_posts(source, broken=4)
+    with pytest.raises(ImportFormatError, match='records 5-6'):
+        run(app, source, checkpoint=str(checkpoint))
+    assert json.loads(checkpoint.read_text()) == {str(source): 4}
+    assert rows(app)['blog_posts'] == 4
+
+    write_posts(source)
+    summary = run(app, source, checkpoint=str(checkpoint))
+    # The committed chunks are not read again.
+    assert (summary['posts'], summary['comments'], summary['ratings'], summary['skipped']) == (2, 2, 2, 0)
+    assert rows(app) == {'users_blog': 2, 'blog_posts': 6, 'comments': 6, 'ratings': 6}
+    assert not checkpoint.exists()
+
+
+def test_rerun_skips_existing_rows(app, tmp_path):
+    source = tmp_path / 'posts.ndjson'
+    write_posts(source)
+    first = run(app, source)
+    imported = rows(app)
+    with app.app_context():
+        totals = db.session.execute(db.select(BlogPost.rating_count, BlogPost.rating_sum)).all()
+
+    second = run(app, source)
+    assert (first['users'], first['posts'], first['comments'], first['ratings']) == (2, 6, 6, 6)
+    assert (second['users'], second['posts'], second['comments'], second['ratings']) == (0, 0, 0, 0)
+    assert second['skipped'] == 18
+    assert rows(app) == imported
+    with app.app_context():
+        assert db.session.execute(db.select(BlogPost.rating_count, BlogPost.rating_sum)).all() == totals
+
+
+def test_imported_author_logs_in_after_set_password(app, client, tmp_path):
+    source = tmp_path / 'posts.ndjson'
+    write_posts(source)
+    run(app, source)
+    credentials = {'email': 'writer@example.com', 'password': 'secret', 'submit': 'Login'}
+
+    response = client.post('/login', data=credentials, follow_redirects=True)
+    assert 'has no password yet' in response.get_data(as_text=True)
+
+    result = app.test_cli_runner().invoke(args=['set-password', 'writer@example.com'], input='secret\nsecret\n')
+    assert result.exit_code == 0, result.output
+    response = client.post('/login', data=credentials)
+    assert response.status_code == 302 and response.location.endswith('/')
@@ -0,0 +1,86 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import event
+
+from extensions import db
+from models.models import BlogPost, Rating, UserBlog
+from pragmas import sqlite_pragmas
+from conftest import create_post, login
+
+
+@pytest.fixture
+def locked_once(app, monkeypatch):
+    # Another connection holds the write lock when the next commit starts and lets go once SQLite has
+    # reported the database locked, so the first commit fails and the retry goes through.
+    monkeypatch.setattr(sqlite_pragmas, 'pragmas', [pragma for pragma in sqlite_pragmas.pragmas
+                                                    if 'busy_timeout' not in pragma] + ['PRAGMA busy_timeout=0'])
+    monkeypatch.setitem(app.config, 'SQLITE_LOCK_BACKOFF', 0.01)
+    with app.app_context():
+        engine = db.engine
+    engine.dispose()
+    holder = sqlite3.connect(engine.url.database, isolation_level=None)
+    errors = []
+
+    def release(context):
+        if 'locked' in str(context.original_exception).lower():
+            errors.append(context.original_exception)
+            holder.execute('ROLLBACK')
+
+    def lock():
+        holder.execute('BEGIN IMMEDIATE')
+
+    event.listen(engine, 'handle_error', release)
+    yield lock, errors
+    event.remove(engine, 'handle_error', release)
+    if holder.in_transaction:
+        holder.execute('ROLLBACK')
+    holder.close()
+    engine.dispose()
+
+
+def add_reader(app, post_id, rating=None):
+    with app.app_context():
+        reader = UserBlog(email='reader@example.com', name='Reader', password='x')
+        db.session.add(reader)
+        db.session.flush()
+        if rating is not None:
+            db.session.add(Rating(value=rating, author_id=reader.id, post_id=post_id))
+            db.session.execute(db.update(BlogPost).values(rating_count=1, rating_sum=rating))
+        db.session.commit()
+        return reader.id
+
+
+def totals(app, post_id):
+    with app.app_context():
+        post = db.session.get(BlogPost, post_id)
+        values = db.session.scalars(db.select(Rating.value).where(Rating.post_id == post_id)).all()
+        return post.rating_count, post.rating_sum, post.version, values
+
+
+def test_new_rating_is_replayed_once(app, client, locked_once):
+    lock, errors = locked_once
+    post_id = create_post(app)
+    login(client, add_reader(app, post_id))
+    version = totals(app, post_id)[2]
+
+    lock()
+    client.post(f'/post/{post_id}', data={'rating': 7, 'submit': 'Submit Rating'})
+
+    assert len(errors) == 1
+    assert totals(app, post_id) == (1, 7, version + 1, [7])
+
+
+def test_rating_edit_is_replayed_once(app, client, locked_once):
+    lock, errors = locked_once
+    post_id = create_post(app)
+    login(client, add_reader(app, post_id, rating=2))
+    with app.app_context():
+        rating_id = db.session.scalars(db.select(Rating.id)).one()
+    version = totals(app, post_id)[2]
+
+    lock()
+    client.post(f'/edit-rating/{rating_id}', data={'rating': 5, 'submit': 'Submit Rating'})
+
+    assert len(errors) == 1
+    assert totals(app, post_id) == (1, 5, version + 1, [5])
@@ -0,0 +1,144 @@
+import logging
+import socket
+from datetime import timedelta
+from email import message_from_bytes
+
+import pytest
+from aiosmtpd.controller import Controller
+
+from extensions import db
+from models.models import OutboxMessage, UserBlog, utcnow
+from outbox import outbox, queue_email, queue_sms
+from conftest import login
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+class Inbox:
+    def __init__(self):
+        self.envelopes = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.envelopes.append(envelope)
+        return '250 OK'
+
+
+class FakeSMS:
+    def __init__(self, error=None):
+        self.error = error
+        self.sent = []
+
+    def send(self, body):
+        if self.error:
+            raise RuntimeError(self.error)
+        self.sent.append(body)
+
+
+@pytest.fixture
+def mail(app, monkeypatch):
+    inbox = Inbox()
+    controller = Controller(inbox, hostname='127.0.0.1', port=free_port())
+    controller.start()
+    for key, value in {'EMAIL_HOST': '127.0.0.1', 'EMAIL_PORT': controller.port, 'EMAIL_START_TLS': False,
+                       'EMAIL_USERNAME': 'blog@example.com', 'EMAIL_PASSWORD': None, 'EMAIL_TIMEOUT': 5}.items():
+        monkeypatch.setitem(app.config, key, value)
+    yield inbox
+    controller.stop()
+
+
+def queue_request(app):
+    with app.app_context():
+        queue_email('Your request to post has been accepted.', 'Hello Reader', recipient='reader@example.com')
+        queue_sms('Reader <reader@example.com> asked to post')
+        db.session.commit()
+
+
+def messages(app):
+    with app.app_context():
+        return {message.channel: message for message in db.session.scalars(db.select(OutboxMessage))}
+
+
+def test_batch_is_delivered(app, mail, monkeypatch):
+    sms = FakeSMS()
+    monkeypatch.setattr(outbox, 'sms_transport', sms)
+    queue_request(app)
+
+    with app.app_context():
+        assert outbox.deliver_due() == 2
+        assert outbox.deliver_due() == 0
+
+    assert [envelope.rcpt_tos for envelope in mail.envelopes] == [['reader@example.com']]
+    assert message_from_bytes(mail.envelopes[0].content).get_payload(decode=True) == b'Hello Reader'
+    assert sms.sent == ['Reader <reader@example.com> asked to post']
+    assert {message.status for message in messages(app).values()} == {'sent'}
+
+
+def test_failures_are_retried_with_backoff(app, mail, monkeypatch):
+    monkeypatch.setattr(outbox, 'sms_transport', FakeSMS(error='Twilio is down'))
+    monkeypatch.setitem(app.config, 'EMAIL_PORT', free_port())
+    monkeypatch.setitem(app.config, 'OUTBOX_MAX_ATTEMPTS', 3)
+    base = app.config['OUTBOX_RETRY_BASE']
+    queue_request(app)
+
+    for attempt in (1, 2):
+        started = utcnow()
+        with app.app_context():
+            assert outbox.deliver_due() == 2
+            # Not due again before the backoff has passed.
+            assert outbox.deliver_due() == 0
+        for message in messages(app).values():
+            assert (message.status, message.attempts) == ('pending', attempt)
+            assert message.last_error
+            backoff = timedelta(seconds=base * 2 ** (attempt - 1))
+            assert backoff <= message.next_attempt_at - started < backoff + timedelta(seconds=5)
+        with app.app_context():
+            db.session.execute(db.update(OutboxMessage).values(next_attempt_at=utcnow()))
+            db.session.commit()
+
+    with app.app_context():
+        outbox.deliver_due()
+        failed = db.session.scalars(db.select(OutboxMessage).where(OutboxMessage.status == 'failed')).all()
+        # A text that can not be sent is reported by email.
+        alert = db.session.scalars(db.select(OutboxMessage).where(OutboxMessage.status == 'pending')).one()
+    assert {message.channel for message in failed} == {'email', 'sms'}
+    assert 'Twilio is down' in alert.body
+
+
+def test_sender_survives_unexpected_errors(app, monkeypatch, caplog):
+    def broken():
+        raise RuntimeError('unexpected')
+
+    monkeypatch.setattr(outbox, 'deliver_due', broken)
+    with caplog.at_level(logging.ERROR, logger='outbox'):
+        outbox.run(once=True)
+    assert 'Outbox delivery failed' in caplog.text
+
+
+def test_posting_requests_in_one_window_send_one_text(app, client, mail, monkeypatch):
+    sms = FakeSMS()
+    monkeypatch.setattr(outbox, 'sms_transport', sms)
+    monkeypatch.setattr('main.routes.verify_recaptcha', lambda response: True)
+    with app.app_context():
+        db.session.add_all([UserBlog(email=f"reader{number}@example.com", name=f"Reader {number}", password='x')
+                            for number in range(3)])
+        db.session.commit()
+    for user_id in (1, 2, 3):
+        login(client, user_id)
+        client.post('/request-posting', data={'reason': 'I write', 'submit': 'Submit Request'})
+
+    with app.app_context():
+        # The emails go out at once, the text waits for the end of the window.
+        assert outbox.deliver_due() == 3
+        assert sms.sent == []
+        db.session.execute(db.update(OutboxMessage).where(OutboxMessage.channel == 'sms')
+                           .values(next_attempt_at=utcnow()))
+        db.session.commit()
+        assert outbox.deliver_due() == 1
+
+    assert len(mail.envelopes) == 3
+    assert sms.sent == ["Requests to post pending (3):\n" + '\n'.join(
+        f"Reader {number} <reader{number}@example.com>" for number in range(3))]
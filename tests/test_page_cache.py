@@ -0,0 +1,54 @@
+import os
+
+from cache import MemoryBackend, FileSystemBackend
+from extensions import db, page_cache
+from models.models import BlogPost, Comment, UserBlog
+from models.transactions import touch_post
+from conftest import create_post
+
+
+def test_cached_post_is_not_served_after_another_worker_changed_it(app, client, monkeypatch):
+    monkeypatch.setattr(page_cache, 'backend', MemoryBackend())
+    post_id = create_post(app, comments=1)
+    first = client.get(f'/post/{post_id}')
+    assert first.headers['X-Page-Cache'] == 'MISS'
+    assert client.get(f'/post/{post_id}').headers['X-Page-Cache'] == 'HIT'
+
+    # A write from another worker: the version moves in the database, this worker's cache is not invalidated.
+    with app.app_context():
+        reader = UserBlog(email='late@example.com', name='Late reader', password='x')
+        db.session.add(reader)
+        db.session.flush()
+        touch_post(db.session.get(BlogPost, post_id))
+        db.session.add(Comment(text='<p>Late comment</p>', author_id=reader.id, post_id=post_id))
+        db.session.commit()
+
+    second = client.get(f'/post/{post_id}')
+    assert second.headers['X-Page-Cache'] == 'MISS'
+    assert second.headers['ETag'] != first.headers['ETag']
+    assert 'Late comment' in second.get_data(as_text=True)
+
+
+def entries(directory):
+    return [name for _, _, names in os.walk(directory) for name in names if name != 'GENERATION']
+
+
+def test_query_arguments_the_view_ignores_share_one_entry(app, client, monkeypatch, tmp_path):
+    monkeypatch.setattr(page_cache, 'backend', FileSystemBackend(str(tmp_path)))
+    create_post(app)
+    statuses = [client.get(f'/?x={number}').headers['X-Page-Cache'] for number in range(10)]
+    assert statuses == ['MISS'] + ['HIT'] * 9
+    assert client.get('/?after=1').headers['X-Page-Cache'] == 'MISS'
+    assert len(entries(tmp_path)) == 2
+
+
+def test_filesystem_backend_drops_expired_and_oldest_entries(tmp_path):
+    backend = FileSystemBackend(str(tmp_path), max_entries=5)
+    for number in range(FileSystemBackend.SWEEP_EVERY * 2):
+        backend.set('index', 0, f'key-{number}', b'body', 'text/html', 300)
+    assert len(entries(tmp_path)) == 5
+
+    backend.set('index', 0, 'expired', b'body', 'text/html', -1)
+    backend.sweep()
+    assert len(entries(tmp_path)) == 5
+    assert backend.get('index', 0, 'expired') is None
@@ -0,0 +1,31 @@
+from sqlalchemy import event
+from extensions import db
+from conftest import create_post
+
+
+def count_queries(app, client, path):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(path)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert response.status_code == 200
+    return len(statements), response.get_data(as_text=True)
+
+
+def test_post_page_queries_do_not_grow_with_the_thread(app, client):
+    short_thread = create_post(app, comments=1, title='One comment')
+    long_thread = create_post(app, comments=500, title='Five hundred comments')
+
+    short_count, _ = count_queries(app, client, f'/post/{short_thread}')
+    long_count, page = count_queries(app, client, f'/post/{long_thread}')
+
+    assert page.count('Reader ') >= 500
+    assert short_count == long_count
@@ -0,0 +1,55 @@
+import pytest
+
+from extensions import db
+from models.models import UserBlog
+from profiler import Profiler, ProfilerMiddleware
+from conftest import login
+
+
+@pytest.fixture
+def profiler(app, monkeypatch, tmp_path):
+    # The session's app runs without the profiler, install one on it for the test.
+    instance = Profiler()
+    instance.enabled, instance.directory = True, str(tmp_path)
+    monkeypatch.setattr(app, 'wsgi_app', ProfilerMiddleware(app, instance))
+    monkeypatch.setitem(app.before_request_funcs, None, app.before_request_funcs[None] + [instance._check])
+    monkeypatch.setitem(app.after_request_funcs, None, app.after_request_funcs[None] + [instance._finish])
+    return instance
+
+
+def add_users(app, count):
+    with app.app_context():
+        db.session.add_all([UserBlog(email=f"user{number}@example.com", name=f"User {number}", password='x')
+                            for number in range(count)])
+        db.session.commit()
+
+
+def test_admin_profiles_a_request(app, client, profiler):
+    add_users(app, 1)
+    login(client, 1)
+    assert client.get('/?_profile=1').status_code == 200
+    assert client.get('/', headers={'X-Profile': '1'}).status_code == 200
+    assert client.get('/').status_code == 200
+
+    profiles = profiler.list()
+    assert [(profile['path'], profile['trigger'], profile['status']) for profile in profiles] == [
+        ('/', 'requested', 200)] * 2
+    assert profiler.report(profiles[0]['id'])[1]
+
+
+@pytest.mark.parametrize('user_id, users', [(None, 0), (2, 2), (1, 0)], ids=['anonymous', 'reader', 'deleted-admin'])
+def test_profile_flag_is_ignored_for_others(app, client, profiler, user_id, users):
+    # A session naming the admin passes the cookie check, but the user must still load as the admin.
+    add_users(app, users)
+    if user_id is not None:
+        login(client, user_id)
+    client.get('/?_profile=1')
+    assert profiler.list() == []
+
+
+def test_streamed_responses_are_not_kept(app, client, profiler):
+    add_users(app, 1)
+    login(client, 1)
+    response = client.get('/export?_profile=1')
+    assert response.status_code == 200 and response.get_data()
+    assert profiler.list() == []
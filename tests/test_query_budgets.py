@@ -0,0 +1,20 @@
+from extensions import db
+from instrumentation import assert_query_budget
+from models.models import Comment, Rating
+from conftest import create_post, login
+
+
+def test_hot_route_query_budgets(app, client):
+    post_ids = [create_post(app, comments=25, title=f"Post {number}") for number in range(3)]
+    with app.app_context():
+        # The first author also comments on and rates the other posts, so every dashboard section has rows.
+        db.session.add_all([Comment(text='<p>Mine</p>', author_id=1, post_id=post_id) for post_id in post_ids[1:]]
+                           + [Rating(value=7.0, author_id=1, post_id=post_id) for post_id in post_ids[1:]])
+        db.session.commit()
+
+    assert_query_budget(client, {'/': 2, f'/post/{post_ids[0]}': 3})
+
+    login(client, 1)
+    # The user loader reads through the user cache, warm it as any earlier request of the session would.
+    client.get('/')
+    assert_query_budget(client, {'/user': 3})
@@ -0,0 +1,90 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from recaptcha import RecaptchaVerifier
+
+
+class FakeSiteverify(BaseHTTPRequestHandler):
+    # Answers like Google's siteverify endpoint: `status` 200 with `success`, or an error status.
+    status = 200
+    success = True
+    hits = 0
+
+    def do_POST(self):
+        type(self).hits += 1
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = json.dumps({'success': self.success}).encode('utf-8')
+        self.send_response(self.status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def endpoint(monkeypatch):
+    monkeypatch.setattr(FakeSiteverify, 'status', 200)
+    monkeypatch.setattr(FakeSiteverify, 'success', True)
+    monkeypatch.setattr(FakeSiteverify, 'hits', 0)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeSiteverify)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield FakeSiteverify, f"http://127.0.0.1:{server.server_port}/siteverify"
+    server.shutdown()
+    server.server_close()
+
+
+def make_verifier(app, monkeypatch, url, fail_open):
+    for key, value in {'RECAPTCHA_VERIFY_URL': url, 'RECAPTCHA_SECRET_KEY': 'secret', 'RECAPTCHA_FAIL_OPEN': fail_open,
+                       'RECAPTCHA_BREAKER_THRESHOLD': 3, 'RECAPTCHA_BREAKER_RESET': 0.2}.items():
+        monkeypatch.setitem(app.config, key, value)
+    monkeypatch.setitem(app.extensions, 'recaptcha', app.extensions['recaptcha'])
+    verifier = RecaptchaVerifier()
+    verifier.init_app(app)
+    return verifier
+
+
+@pytest.mark.parametrize('fail_open', [False, True])
+def test_breaker_opens_after_consecutive_failures(app, monkeypatch, endpoint, fail_open):
+    handler, url = endpoint
+    verifier = make_verifier(app, monkeypatch, url, fail_open)
+    handler.success = False
+    assert verifier.verify('token') is False
+    handler.status = 500
+
+    answers = [verifier.verify('token') for _ in range(5)]
+    # Three failures reach the endpoint and open the breaker, the next calls are answered without it.
+    assert answers == [fail_open] * 5
+    assert handler.hits == 4
+    assert verifier.breaker.state == 'open'
+    assert verifier.stats()['short_circuited'] == 2
+
+
+def test_half_open_trial_closes_the_breaker(app, monkeypatch, endpoint):
+    handler, url = endpoint
+    verifier = make_verifier(app, monkeypatch, url, False)
+    handler.status = 500
+    for _ in range(3):
+        verifier.verify('token')
+    assert verifier.breaker.state == 'open'
+
+    time.sleep(0.25)
+    assert verifier.breaker.state == 'half-open'
+    # A failed trial opens the breaker again for another reset period.
+    assert verifier.verify('token') is False
+    assert verifier.breaker.state == 'open'
+
+    time.sleep(0.25)
+    handler.status = 200
+    hits = handler.hits
+    assert verifier.verify('token') is True
+    assert handler.hits == hits + 1
+    assert verifier.breaker.state == 'closed'
+    assert verifier.verify('token') is True
@@ -0,0 +1,49 @@
+import os
+import sqlite3
+import tempfile
+
+from sqlalchemy import create_engine
+
+from extensions import db
+from models.models import BlogPost, Rating, UserBlog
+from conftest import create_post, login
+
+
+def stale_replica(app, monkeypatch):
+    # A copy of the primary as it is now; later writes to the primary don't reach it, like a lagging replica.
+    path = os.path.join(tempfile.mkdtemp(prefix='the-blog-replica-'), 'replica.db')
+    with app.app_context():
+        primary = sqlite3.connect(db.engine.url.database)
+        replica = sqlite3.connect(path)
+        primary.backup(replica)
+        primary.close()
+        replica.close()
+        monkeypatch.setitem(db.engines, 'replica-1', create_engine(f"sqlite:///{path}"))
+    monkeypatch.setitem(app.config, 'REPLICA_PIN_SECONDS', 0)
+
+
+def test_rating_edit_reads_the_primary(app, client, monkeypatch):
+    post_id = create_post(app)
+    with app.app_context():
+        reader = UserBlog(email='reader@example.com', name='Reader', password='x')
+        db.session.add(reader)
+        db.session.flush()
+        rating = Rating(value=2, author_id=reader.id, post_id=post_id)
+        db.session.add(rating)
+        db.session.execute(db.update(BlogPost).values(rating_count=1, rating_sum=2))
+        db.session.commit()
+        reader_id, rating_id = reader.id, rating.id
+    stale_replica(app, monkeypatch)
+    with app.app_context():
+        db.session.execute(db.update(Rating).values(value=4))
+        db.session.execute(db.update(BlogPost).values(rating_sum=4))
+        db.session.commit()
+
+    login(client, reader_id)
+    client.post(f'/edit-rating/{rating_id}', data={'rating': 5, 'submit': 'Submit Rating'})
+
+    with app.app_context():
+        post = db.session.get(BlogPost, post_id)
+        # Computed from the replica's value the sum would be 4 + 5 - 2.
+        assert (post.rating_count, post.rating_sum) == (1, 5)
+        assert db.session.get(Rating, rating_id).value == 5
@@ -0,0 +1,73 @@
+import threading
+import time
+from collections import OrderedDict
+from flask_login import UserMixin
+from extensions import db
+from models.models import UserBlog
+
+SNAPSHOT_FIELDS = ('id', 'name', 'email', 'add_post', 'request')
+
+
+class CachedUser(UserMixin):
+    # What Flask-Login exposes as current_user: the snapshot fields are plain attributes, anything else
+    # (posts, comments, ...) is read from the UserBlog row, loaded on first use.
+    def __init__(self, snapshot):
+        for field in SNAPSHOT_FIELDS:
+            setattr(self, field, snapshot[field])
+        self._entity = None
+
+    @property
+    def entity(self):
+        if self._entity is None:
+            self._entity = db.session.get(UserBlog, self.id)
+        return self._entity
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.entity, name)
+
+
+class UserCache:
+    # Per-process snapshots keyed by user id. Writes that change a snapshot field call invalidate(), other
+    # workers catch up when their entry expires after USER_CACHE_TTL seconds.
+    def __init__(self):
+        self.ttl = 30
+        self.max_entries = 1024
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config.get('USER_CACHE_TTL', 30)
+        self.max_entries = app.config.get('USER_CACHE_SIZE', 1024)
+        app.extensions['user_cache'] = self
+
+    def load(self, user_id):
+        user_id = int(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                return CachedUser(entry[1])
+
+        user = db.session.get(UserBlog, user_id)
+        if user is None:
+            return None
+        snapshot = {field: getattr(user, field) for field in SNAPSHOT_FIELDS}
+        if self.ttl > 0:
+            with self._lock:
+                self._entries[user_id] = (time.monotonic() + self.ttl, snapshot)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        cached = CachedUser(snapshot)
+        cached._entity = user
+        return cached
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(int(user_id), None)
+
+
+user_cache = UserCache()
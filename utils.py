@@ -1,9 +1,7 @@
-from flask import current_app
-from twilio.rest import Client
-from twilio.base.exceptions import TwilioRestException
-import asyncio
-import aiosmtplib
-import requests
+from flask import request
+from functools import lru_cache
+from extensions import gravatar, recaptcha
+import hashlib
 import html
 import re
 
@@ -12,69 +10,36 @@ def sanitize_input(input_text):
     return html.escape(input_text.strip())
 
 
+def html_to_text(markup):
+    # Visible text of CKEditor HTML, for indexing and summaries.
+    markup = re.sub(r'(?is)<(script|style)\b.*?</\1>', ' ', markup or '')
+    return re.sub(r'\s+', ' ', html.unescape(re.sub(r'<[^>]+>', ' ', markup))).strip()
+
+
 def validate_email(email):
     pattern = r"(^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$)"
     return re.match(pattern, email) is not None
 
 
-async def verify_recaptcha(recaptcha_response):
-    secret = current_app.config['RECAPTCHA_SECRET_KEY']
-    payload = {'secret': secret, 'response': recaptcha_response}
-    response = requests.post('https://www.google.com/recaptcha/api/siteverify', data=payload)
-    result = response.json()
-    return result.get("success", False)
-
-
-async def send_email_async(message, recepient_email):
-    email_username = current_app.config['EMAIL_USERNAME']
-    if not recepient_email:
-        recepient_email = email_username
-    message["From"] = email_username
-    message["To"] = recepient_email
-
-    try:
-        await aiosmtplib.send(
-            message,
-            hostname=current_app.config['EMAIL_HOST'],
-            port=current_app.config['EMAIL_PORT'],
-            start_tls=True,
-            username=email_username,
-            password=current_app.config['EMAIL_PASSWORD'])
-        return True
-    except Exception as error:
-        print(f"Error sending email to {recepient_email}: {str(error)}")
-        return False
-
-
-async def send_text(message: str) -> dict:
-    try:
-        client = Client(
-            current_app.config['TWILIO_ACCOUNT_SID'],
-            current_app.config['TWILIO_AUTH_TOKEN']
-        )
+@lru_cache(maxsize=1024)
+def avatar_hash(email):
+    return hashlib.md5(email.strip().lower().encode('utf-8')).hexdigest()
 
-        response = client.messages.create(
-            body=message,
-            from_=current_app.config['TWILIO_PHONE_NUMBER'],
-            to=current_app.config['RECIPIENT_PHONE_NUMBER']
-        )
-        print(f"Message sent successfully. Status: {response.status}")
-        return {
-            'success': True,
-            'status': response.status,
-            'sid': response.sid
-        }
 
-    except TwilioRestException as e:
-        print(f"Failed to send message: {str(e)}")
-        return {
-            'success': False,
-            'error': str(e),
-            'code': e.code
-        }
+def avatar_url(user):
+    # Uses the hash stored on the user, the LRU covers accounts that have not been backfilled yet.
+    digest = user.avatar_hash or avatar_hash(user.email)
+    if gravatar.base_url is not None:
+        url = gravatar.base_url + 'avatar/'
+    elif gravatar.use_ssl:
+        url = 'https://secure.gravatar.com/avatar/'
+    else:
+        url = 'http://www.gravatar.com/avatar/'
+    link = f"{url}{digest}?s={gravatar.size}&d={gravatar.default}&r={gravatar.rating}"
+    if gravatar.force_default:
+        link += '&f=y'
+    return link
 
 
-def text_unsent(msg):
-    msg['Subject'] = f"An error occurred while sending a text message"
-    asyncio.run(send_email_async(message=msg, recepient_email=None))
-    print('Text sending error, notified')
+def verify_recaptcha(recaptcha_response):
+    return recaptcha.verify(recaptcha_response, remote_ip=request.remote_addr)